@@ -0,0 +1,54 @@
+"""In process stand-ins for the database so the benchmarks only measure
+the time spent in storm"""
+from storm.compat import coroutine
+from storm.db import Connection
+from storm.mysql import MySql
+
+
+class MemoryCursor(object):
+    def __init__(self, rows, lastrowid=None):
+        self.rows = rows
+        self.rowcount = len(rows)
+        self.lastrowid = lastrowid
+
+    def fetchone(self):
+        return self.rows[0] if len(self.rows) > 0 else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class MemoryPool(object):
+    """Answers every query right away the way tornado_mysql's Pool would
+
+    Selects get copies of the rows, counts get the number of rows and inserts
+    get the next id.  The server settings are the ones where a multiple row
+    insert gets consecutive ids.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.last_id = 0
+
+    @coroutine
+    async def execute(self, sql, params=None):
+        if sql.startswith('INSERT'):
+            self.last_id += 1
+            return MemoryCursor([], self.last_id)
+
+        if sql.startswith('UPDATE') or sql.startswith('DELETE'):
+            return MemoryCursor([{}])
+
+        if sql.startswith('SELECT @@'):
+            return MemoryCursor([{'lock_mode': 1, 'increment': 1}])
+
+        if sql.startswith('SELECT count(*)'):
+            return MemoryCursor([{'count': len(self.rows)}])
+
+        return MemoryCursor([dict(row) for row in self.rows])
+
+
+def memory_mysql(rows):
+    db = MySql(Connection())
+    db.db = MemoryPool(rows)
+    db.is_connected = True
+    return db
@@ -0,0 +1,299 @@
+"""Measures the overhead of storm's hot paths with no database behind them
+
+python benchmarks/run.py                 run everything and compare to the baseline
+python benchmarks/run.py find save       only run some of them
+python benchmarks/run.py --save          store the results as the new baseline
+python benchmarks/run.py --check         exit with 1 if anything regressed
+
+Each benchmark reports operations per second, the 50th, 90th and 99th
+percentile time per call from the fastest of a few rounds and the peak
+memory allocated by one call.  The
+baseline in baseline.json is only comparable to runs on the same machine so
+save a new one before comparing changes.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tracemalloc
+from tornado import gen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storm.collection import Collection
+from storm.model import Model
+from storm.mysql import MySql, Query
+
+from fakes import memory_mysql
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# how much slower than the baseline a benchmark can get before it counts as
+# a regression
+TOLERANCE = 0.2
+
+ROUNDS = 5
+
+ROW = {
+    'id': 1,
+    'name': 'Bob',
+    'email': 'bob@example.com',
+    'age': 30,
+    'settings': '{"theme": "dark", "emails": true}'
+}
+
+_benchmarks = []
+
+
+def benchmark(name, calls=20000):
+    def register(func):
+        _benchmarks.append((name, func, calls))
+        return func
+
+    return register
+
+
+class User(Model):
+    _table = 'users'
+    _primary_key = 'id'
+    _json_fields = ['settings']
+
+    # every find should go through to the database
+    _coalesce_finds = False
+
+
+@benchmark('convert_object')
+def convert_object():
+    User._convert_object(dict(ROW))
+
+
+_page = [dict(ROW, id=i) for i in range(1000)]
+
+
+@benchmark('load_1000_rows', calls=200)
+async def load_1000_rows():
+    await User._load_objects([dict(row) for row in _page])
+
+
+_tracked = User._convert_object(dict(ROW))
+
+
+@benchmark('setattr')
+def setattr_():
+    # a new value every time so the change is always recorded
+    _tracked.age += 1
+    _tracked._changes = []
+
+
+@benchmark('save_insert')
+async def save_insert():
+    user = User()
+    user.name = 'Bob'
+    user.email = 'bob@example.com'
+    await user.save()
+
+
+_saved = User._convert_object(dict(ROW))
+
+
+@benchmark('save_update')
+async def save_update():
+    _saved.age += 1
+    await _saved.save()
+
+
+@benchmark('find')
+async def find():
+    await User.find(id=1)
+
+
+# the same calls made the way code written for the gen.coroutine methods
+# makes them, to show what the native coroutines save per call
+
+@gen.coroutine
+def _find_gen():
+    yield User.find(id=1)
+
+
+@gen.coroutine
+def _save_gen():
+    _saved.age += 1
+    yield _saved.save()
+
+
+@benchmark('find_gen_coroutine')
+async def find_gen_coroutine():
+    await _find_gen()
+
+
+@benchmark('save_gen_coroutine')
+async def save_gen_coroutine():
+    await _save_gen()
+
+
+@benchmark('find_all', calls=2000)
+async def find_all():
+    await User.find_all(Query('SELECT * FROM :table'), page=1, page_size=50)
+
+
+@benchmark('find_all_raw', calls=2000)
+async def find_all_raw():
+    await User.find_all(Query('SELECT * FROM :table'), page=1, page_size=50, as_raw=True)
+
+
+@benchmark('find_all_columns', calls=2000)
+async def find_all_columns():
+    await User.find_all(Query('SELECT * FROM :table'), page=1, page_size=50, as_columns=True)
+
+
+_values = [None, 12, 1.5, 'it\'s', b'bytes', 'NOW()']
+
+
+@benchmark('quote')
+def quote():
+    for value in _values:
+        MySql._quote(value)
+
+
+@benchmark('query_sql')
+def query_sql():
+    query = Query('SELECT * FROM :table WHERE user_id = :user_id')
+    query.bind(':table', 'posts')
+    query.bind(':user_id', 1)
+    query.filter('status', '=', 'published')
+    query.filter('category', 'in', [1, 2, 3])
+    query.limit = 10
+    query.sql
+
+
+_collection = Collection()
+_collection.extend([User._convert_object(dict(ROW)) for i in range(50)])
+_collection.page = 1
+_collection.page_size = 50
+_collection.total_count = 500
+
+
+@benchmark('collection_to_dict')
+def collection_to_dict():
+    _collection.to_dict()
+
+
+def percentile(times, percent):
+    return times[min(len(times) - 1, int(len(times) * percent / 100))]
+
+
+async def measure(func, calls):
+    is_async = asyncio.iscoroutinefunction(func)
+
+    # warm up the caches
+    for i in range(min(calls // 10, 1000)):
+        if is_async:
+            await func()
+        else:
+            func()
+
+    # the fastest of a few rounds so other things running on the machine
+    # don't show up as regressions
+    best = None
+    for round in range(ROUNDS):
+        times = []
+        start = time.perf_counter()
+        for i in range(calls):
+            call_start = time.perf_counter()
+            if is_async:
+                await func()
+            else:
+                func()
+
+            times.append(time.perf_counter() - call_start)
+
+        elapsed = time.perf_counter() - start
+        times.sort()
+        if best is None or times[len(times) // 2] < best[0][len(best[0]) // 2]:
+            best = (times, elapsed)
+
+    times, elapsed = best
+
+    # the peak memory used by a call, measured on its own since tracing
+    # slows everything down
+    tracemalloc.start()
+    peaks = []
+    for i in range(min(calls, 200)):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        if is_async:
+            await func()
+        else:
+            func()
+
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+
+    tracemalloc.stop()
+
+    peaks.sort()
+    return {
+        'ops': calls / elapsed,
+        'p50': percentile(times, 50) * 1000000,
+        'p90': percentile(times, 90) * 1000000,
+        'p99': percentile(times, 99) * 1000000,
+        'alloc': percentile(peaks, 50)
+    }
+
+
+def compare(name, result, baseline):
+    """returns a note about how the result compares to the baseline and if
+    it is a regression"""
+    if name not in baseline:
+        return ('new', False)
+
+    change = result['p50'] / baseline[name]['p50'] - 1
+    return ('%+.0f%%' % (change * 100), change > TOLERANCE)
+
+
+async def main(args):
+    names = [arg for arg in args if not arg.startswith('--')]
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    Model.set_db(memory_mysql([ROW]))
+
+    results = {}
+    regressions = []
+    print('%-20s %12s %10s %10s %10s %10s %8s' % ('benchmark', 'ops/sec', 'p50 us', 'p90 us', 'p99 us', 'alloc B', 'change'))
+    for name, func, calls in _benchmarks:
+        if len(names) > 0 and name not in names:
+            continue
+
+        # find_all needs a page worth of rows
+        Model.db.db.rows = [dict(ROW, id=i) for i in range(50)] if name.startswith('find_all') else [ROW]
+
+        result = await measure(func, calls)
+        results[name] = result
+
+        note, regressed = compare(name, result, baseline)
+        if regressed:
+            regressions.append(name)
+
+        print('%-20s %12.0f %10.1f %10.1f %10.1f %10d %8s' % (name, result['ops'], result['p50'],
+                                                             result['p90'], result['p99'],
+                                                             result['alloc'], note))
+
+    if '--save' in args:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if len(regressions) > 0:
+        print('\nslower than the baseline: %s' % ', '.join(regressions))
+        if '--check' in args:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(sys.argv[1:])))
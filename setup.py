@@ -11,7 +11,8 @@ setup(
     url='https://github.com/ccampbell/storm',
     download_url='https://github.com/ccampbell/storm/archive/%s.zip#egg=tornado-storm-%s' % (version, version),
     license='MIT',
-    install_requires=['tornado >= 4.0', 'tornado_mysql >= 0.5', 'motor >= 0.1.1'],
+    python_requires='>=3.7',
+    install_requires=['tornado >= 6.0', 'tornado_mysql >= 0.5', 'motor >= 2.0'],
     packages=find_packages(),
     py_modules=['storm'],
     platforms=["any"]
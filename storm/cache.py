@@ -0,0 +1,281 @@
+import json
+import pickle
+import time
+import asyncio
+from collections import OrderedDict
+from storm.compat import coroutine
+
+
+class CountCache(object):
+    """Keeps the total counts for paginated queries for ttl seconds
+
+    Counts are stored per table so saving or deleting any object in a table
+    throws away every count for it, in every database.  The backends put the
+    database in the key since the same table can be in more than one.
+    """
+    def __init__(self, ttl=60, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._counts = {}
+
+    def get(self, table, key):
+        counts = self._counts.get(table)
+        if counts is None or key not in counts:
+            return None
+
+        expires, count = counts[key]
+        if expires < time.time():
+            del(counts[key])
+            return None
+
+        return count
+
+    def set(self, table, key, count):
+        now = time.time()
+        counts = self._counts.setdefault(table, {})
+
+        if len(counts) >= self.max_size:
+            for old_key in [k for k in counts if counts[k][0] < now]:
+                del(counts[old_key])
+
+            if len(counts) >= self.max_size:
+                counts.clear()
+
+        counts[key] = (now + self.ttl, count)
+
+    def invalidate(self, table):
+        self._counts.pop(table, None)
+
+    def clear(self):
+        self._counts = {}
+
+
+count_cache = CountCache()
+
+
+class Cache(object):
+    """Base class for the caches that Model.find can read through
+
+    Set _cache on a model class to use one:
+
+    class User(Model):
+        _cache = LruCache(size=10000, ttl=60)
+
+    Subclasses implement the get, set and delete coroutines.  get returns
+    None for keys that aren't cached.
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # the keys that are cached for each row so they can all be thrown
+        # away when the row is saved or deleted
+        self._keys_by_row = {}
+        self._row_by_key = {}
+
+    @coroutine
+    async def get(self, key):
+        raise NotImplementedError('The "get" method is not implemented')
+
+    @coroutine
+    async def set(self, key, value):
+        raise NotImplementedError('The "set" method is not implemented')
+
+    @coroutine
+    async def delete(self, key):
+        raise NotImplementedError('The "delete" method is not implemented')
+
+    def _track(self, key, row):
+        self._keys_by_row.setdefault(row, set()).add(key)
+        self._row_by_key[key] = row
+
+    def _forget(self, key):
+        row = self._row_by_key.pop(key, None)
+        if row is None:
+            return
+
+        keys = self._keys_by_row.get(row)
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del(self._keys_by_row[row])
+
+    @staticmethod
+    def make_key(table, lookup, database=None):
+        """database is the Connection.get_key of the database the row came
+        from so rows from databases bound with storm.context stay apart"""
+        lookup = json.dumps(sorted(lookup.items()), default=str, separators=(',', ':'))
+        if database is None:
+            return 'storm:%s:%s' % (table, lookup)
+
+        return 'storm:%s:%s:%s' % (database, table, lookup)
+
+    @coroutine
+    async def get_row(self, table, lookup, database=None):
+        row = await self.get(Cache.make_key(table, lookup, database))
+
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return row
+
+    @coroutine
+    async def set_row(self, table, lookup, row_id, row, database=None):
+        key = Cache.make_key(table, lookup, database)
+        self._track(key, (database, table, row_id))
+        await self.set(key, row)
+
+        return True
+
+    @coroutine
+    async def invalidate(self, table, row_id, primary_key_lookup, database=None):
+        keys = set(self._keys_by_row.get((database, table, row_id), ()))
+
+        # the key for looking the row up by its primary key is always
+        # removed so that lookups cached by other processes sharing an
+        # external cache are cleared too
+        keys.add(Cache.make_key(table, primary_key_lookup, database))
+        for key in keys:
+            self._forget(key)
+
+        await asyncio.gather(*[self.delete(key) for key in keys])
+
+        return True
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class LruCache(Cache):
+    """Keeps up to size rows in process for ttl seconds"""
+    def __init__(self, size=10000, ttl=60):
+        super(LruCache, self).__init__(ttl)
+        self.size = size
+        self._rows = OrderedDict()
+
+    def _get(self, key):
+        if key not in self._rows:
+            return None
+
+        expires, value = self._rows[key]
+        if expires < time.time():
+            del(self._rows[key])
+            self._forget(key)
+            return None
+
+        # move it to the end so it is the last to be evicted
+        del(self._rows[key])
+        self._rows[key] = (expires, value)
+
+        # the model changes the row it is given so hand out copies
+        return dict(value)
+
+    def _set(self, key, value):
+        self._rows.pop(key, None)
+        while len(self._rows) >= self.size:
+            self._forget(self._rows.popitem(last=False)[0])
+            self.evictions += 1
+
+        self._rows[key] = (time.time() + self.ttl, dict(value))
+
+    @coroutine
+    async def get(self, key):
+        value = self._get(key)
+
+        return value
+
+    @coroutine
+    async def set(self, key, value):
+        self._set(key, value)
+
+        return True
+
+    @coroutine
+    async def delete(self, key):
+        self._rows.pop(key, None)
+
+        return True
+
+    def stats(self):
+        stats = super(LruCache, self).stats()
+        stats['size'] = len(self._rows)
+        return stats
+
+
+class ClientCache(Cache):
+    """Stores rows in an external cache like memcached or redis
+
+    The client needs get(key), set(key, value, ttl) and delete(key) methods
+    that return futures.  Rows are pickled so they keep their types.
+
+    The keys a process caches for each row are only tracked by that process
+    so other processes clear them when they expire.  Lookups by primary key
+    are cleared everywhere.
+    """
+    def __init__(self, client, ttl=60, max_tracked_keys=100000):
+        super(ClientCache, self).__init__(ttl)
+        self.client = client
+        self.max_tracked_keys = max_tracked_keys
+
+    def _track(self, key, row):
+        # there is no way to tell when the external cache expires a key so
+        # start over once too many are being tracked
+        if len(self._row_by_key) >= self.max_tracked_keys:
+            self._keys_by_row = {}
+            self._row_by_key = {}
+
+        super(ClientCache, self)._track(key, row)
+
+    @coroutine
+    async def get(self, key):
+        value = await self.client.get(key)
+        if value is not None:
+            value = pickle.loads(value)
+
+        return value
+
+    @coroutine
+    async def set(self, key, value):
+        await self.client.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.ttl)
+
+        return True
+
+    @coroutine
+    async def delete(self, key):
+        await self.client.delete(key)
+
+        return True
+
+
+class MemoryClient(object):
+    """An in process stand in for an external cache client"""
+    def __init__(self):
+        self._values = {}
+
+    @coroutine
+    async def get(self, key):
+        if key not in self._values:
+            return None
+
+        expires, value = self._values[key]
+        if expires < time.time():
+            del(self._values[key])
+            return None
+
+        return value
+
+    @coroutine
+    async def set(self, key, value, ttl):
+        self._values[key] = (time.time() + ttl, value)
+
+    @coroutine
+    async def delete(self, key):
+        self._values.pop(key, None)
@@ -0,0 +1,38 @@
+import json
+
+# the module used to encode and decode the _json_fields on models
+_json = json
+
+
+def set_json(module=None):
+    """Changes the json module used for the _json_fields on models
+
+    Anything with loads and dumps works, ujson or orjson for example:
+
+    import orjson
+    codec.set_json(orjson)
+
+    Without a module it goes back to the json module.
+    """
+    global _json
+    if module is None:
+        module = json
+
+    if not hasattr(module, 'loads') or not hasattr(module, 'dumps'):
+        raise TypeError('%r does not have loads and dumps' % module)
+
+    _json = module
+
+
+def loads(value):
+    return _json.loads(value)
+
+
+def dumps(value):
+    value = _json.dumps(value)
+
+    # orjson returns bytes
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+
+    return value
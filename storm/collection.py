@@ -1,19 +1,248 @@
-class Collection(list):
-    def __init__(self):
+import base64
+import datetime
+import json
+from collections import deque
+from operator import itemgetter
+from storm.error import StormError
+from storm.compat import coroutine, maybe_await
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# how find_all works out the total count for a page
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_CACHED = 'cached'
+COUNT_NONE = 'none'
+
+
+def get_count_policy(count):
+    if count is True:
+        return COUNT_EXACT
+
+    if count is False or count is None:
+        return COUNT_NONE
+
+    if count not in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_CACHED, COUNT_NONE):
+        raise StormError('unknown count policy: %s' % count)
+
+    return count
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+
+    # things like ObjectId get turned back into the right type by the
+    # backend that uses them
+    return str(value)
+
+
+def _decode_value(obj):
+    if '$datetime' in obj:
+        value = obj['$datetime']
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+
+    if '$date' in obj:
+        return datetime.datetime.strptime(obj['$date'], '%Y-%m-%d').date()
+
+    return obj
+
+
+def encode_cursor(values):
+    """turns the sort values for the last object on a page into an opaque
+    token that can be passed back to find_all as after"""
+    data = json.dumps(values, default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        token = str(token)
+        data = base64.urlsafe_b64decode((token + '=' * (-len(token) % 4)).encode('ascii'))
+        values = json.loads(data.decode('utf-8'), object_hook=_decode_value)
+    except (TypeError, ValueError):
+        raise StormError('invalid cursor: %s' % token)
+
+    if not isinstance(values, list):
+        raise StormError('invalid cursor: %s' % token)
+
+    return values
+
+
+class _Page(object):
+    """What find_all sets on its result about the page that was loaded"""
+    def _init_page(self):
         self.total_count = None
         self.page = None
         self.page_size = None
-        super(Collection, self).__init__(self)
+        self.next_cursor = None
+
+        # set when the page was loaded without an exact count.  in that case
+        # one extra object is fetched to tell if there is another page
+        self.has_more = None
 
     def has_previous(self):
         return self.page is not None and self.page > 1
 
     def has_next(self):
+        if self.has_more is not None:
+            return self.has_more
+
         return self.page is not None and self.total_count > (self.page * self.page_size)
 
+
+class Collection(_Page, list):
+    # the names for the values in each tuple with find_all(as_tuples=True)
+    columns = None
+
+    def __init__(self):
+        self._init_page()
+        super(Collection, self).__init__(self)
+
     def to_dict(self):
-        data = self.__dict__
+        # a copy so the methods below don't get replaced by their values
+        data = dict(self.__dict__)
         data['objects'] = self[:]
         data['has_next'] = self.has_next()
         data['has_previous'] = self.has_previous()
         return data
+
+
+class ColumnCollection(_Page, dict):
+    """What find_all(as_columns=True) returns, a dictionary of column name
+    to the values of that column for every row.  The values are numpy
+    arrays if numpy is installed."""
+    def __init__(self, columns=None):
+        self._init_page()
+        super(ColumnCollection, self).__init__(columns or {})
+
+    def to_dict(self):
+        data = dict(self.__dict__)
+        data['columns'] = dict(self)
+        data['has_next'] = self.has_next()
+        data['has_previous'] = self.has_previous()
+        return data
+
+
+def get_columns(rows):
+    """returns the names of the fields in rows in the order they first show
+    up and if every row has the same ones"""
+    if len(rows) == 0:
+        return ([], True)
+
+    keys = rows[0].keys()
+    columns = list(keys)
+    same = True
+    for row in rows:
+        if row.keys() == keys:
+            continue
+
+        # mongodb documents don't all have the same fields
+        same = False
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    return (columns, same)
+
+
+def rows_to_tuples(rows):
+    """returns (column names, a tuple for each row)"""
+    columns, same = get_columns(rows)
+    if same and len(columns) > 1:
+        get = itemgetter(*columns)
+        return (columns, [get(row) for row in rows])
+
+    return (columns, [tuple([row.get(column) for column in columns]) for row in rows])
+
+
+def rows_to_columns(rows, use_numpy=True):
+    """returns {column name: values} with the values as numpy arrays when
+    numpy is installed and use_numpy is set"""
+    columns = get_columns(rows)[0]
+    data = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        data[column] = numpy.array(values) if use_numpy and numpy is not None else values
+
+    return data
+
+
+class ResultIterator(object):
+    """Iterates over the results of a query without loading all of them
+
+    users = User.iter_all(query)
+    while True:
+        batch = yield users.next_batch()
+        if len(batch) == 0:
+            break
+
+    async with User.iter_all(query) as users:
+        async for user in users:
+            ...
+
+    The cursor holds on to a connection until the last row has been read.
+    Leaving the async with block releases it even if the loop stopped
+    early, otherwise call close() when you stop before the end.
+    """
+    def __init__(self, class_name, data, batch_size=500):
+        self.class_name = class_name
+        self.data = data
+        self.batch_size = batch_size
+        self._stream = None
+        self._buffer = deque()
+        self._closed = False
+
+    @coroutine
+    async def next_batch(self):
+        """returns the next list of objects or an empty list at the end"""
+        if self._closed:
+            return []
+
+        if self._stream is None:
+            self._stream = await self.class_name._select_iter(self.data, self.batch_size)
+
+        rows = await self._stream.fetch_batch()
+
+        convert = self.class_name._get_converter()
+        objects = [convert(row) for row in rows]
+        if len(objects) > 0:
+            await maybe_await(self.class_name.after_load_many(objects))
+
+        return objects
+
+    @coroutine
+    async def close(self):
+        self._closed = True
+        self._buffer.clear()
+        if self._stream is not None:
+            await self._stream.close()
+
+        return True
+
+    aclose = close
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if len(self._buffer) == 0:
+            self._buffer.extend(await self.next_batch())
+
+            if len(self._buffer) == 0:
+                raise StopAsyncIteration
+
+        return self._buffer.popleft()
@@ -0,0 +1,45 @@
+import asyncio
+import inspect
+import functools
+
+
+def coroutine(func):
+    """Decorator for the async def methods in storm
+
+    Calling the method returns the coroutine so it can be awaited, or yielded
+    from a tornado gen.coroutine, without wrapping it in a future first.
+
+    The callback keyword that every method used to take still works.  When it
+    is passed the coroutine is started as a task and the callback gets the
+    result once it is done:
+
+    User.find(id=1, callback=on_user)
+
+    Without a callback nothing is wrapped in a future, so code written for the
+    gen.coroutine methods has to change where it used the future directly:
+
+    - IOLoop.add_future and add_done_callback need asyncio.ensure_future(...)
+    - calling save() without waiting for it doesn't run it, use
+      IOLoop.current().spawn_callback(obj.save) or asyncio.ensure_future
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        callback = kwargs.pop('callback', None)
+        if callback is None:
+            return func(*args, **kwargs)
+
+        future = asyncio.ensure_future(func(*args, **kwargs))
+        future.add_done_callback(lambda future: callback(future.result()))
+        return future
+
+    return wrapper
+
+
+async def maybe_await(value):
+    """awaits value if it can be awaited.  hooks like before_save used to be
+    yielded from a gen.coroutine which accepts None so overrides that are
+    plain functions still work"""
+    if inspect.isawaitable(value):
+        return await value
+
+    return value
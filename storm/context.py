@@ -0,0 +1,121 @@
+import contextvars
+
+# the scope for the request (or any other unit of work) that is currently
+# running.  contextvars are copied into every coroutine and task that tornado
+# starts so a scope bound while handling one request is never visible to
+# another request running concurrently on the same IOLoop
+_current_scope = contextvars.ContextVar('storm_scope', default=None)
+
+
+class IdentityMap(object):
+    """Keeps one instance per object loaded in a scope
+
+    Once an object has been loaded finding it again by primary key returns
+    the same instance without going to the database.
+    """
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, class_name, row_id):
+        return self._objects.get((class_name, row_id))
+
+    def add(self, obj):
+        """keeps obj unless there already is one for its primary key and
+        returns the one that is kept"""
+        key = (type(obj), obj._get_row_id(obj._get_primary_key_values()))
+        return self._objects.setdefault(key, obj)
+
+    def replace(self, obj):
+        """keeps obj in place of any other one with its primary key.  used
+        when obj was saved since it is what is in the database now"""
+        key = (type(obj), obj._get_row_id(obj._get_primary_key_values()))
+        self._objects[key] = obj
+
+    def remove(self, obj):
+        key = (type(obj), obj._get_row_id(obj._get_primary_key_values()))
+        if self._objects.get(key) is obj:
+            del(self._objects[key])
+
+    def clear(self):
+        self._objects = {}
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class Scope(object):
+    def __init__(self, db=None, identity_map=False):
+        self.db = db
+        self.identity_map = IdentityMap() if identity_map else None
+
+        # set once something in the scope writes to a primary so the reads
+        # after it don't go to a replica that hasn't caught up yet.  see
+        # storm.routing.ReplicaPool
+        self.read_primary = False
+
+
+def current_scope():
+    return _current_scope.get()
+
+
+def bound_db():
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+
+    return scope.db
+
+
+def identity_map():
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+
+    return scope.identity_map
+
+
+class bind(object):
+    """Binds a database or connection pool to the current context
+
+    with bind(db):
+        user = yield User.find(id=1)
+
+    With identity_map=True the objects loaded in the context are kept in an
+    IdentityMap so each one is only loaded once.
+    """
+    def __init__(self, db=None, identity_map=False):
+        self.scope = Scope(db, identity_map)
+        self._token = None
+
+    def __enter__(self):
+        # a nested context keeps using the db of the one around it
+        if self.scope.db is None:
+            self.scope.db = bound_db()
+
+        self._token = _current_scope.set(self.scope)
+        return self.scope
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_scope.reset(self._token)
+        self._token = None
+
+
+class RequestScopeMixin(object):
+    """Mixin for tornado.web.RequestHandler
+
+    If the handler has a db property it is bound for the rest of the request
+    so every Model lookup made while handling it uses that db.  Set
+    use_identity_map to True to get an IdentityMap for each request.
+
+    class Handler(RequestScopeMixin, RequestHandler):
+        def initialize(self, db):
+            self.db = db
+    """
+    use_identity_map = False
+
+    def prepare(self):
+        # prepare runs inside of the coroutine that tornado starts for this
+        # request so setting the scope here makes it visible to the get/post
+        # method but nothing outside of the request
+        _current_scope.set(Scope(getattr(self, 'db', None), self.use_identity_map))
+        return super(RequestScopeMixin, self).prepare()
@@ -1,6 +1,6 @@
 import time
 from storm import error
-from tornado import gen
+from storm.compat import coroutine
 
 
 class Connection(object):
@@ -11,6 +11,10 @@ class Connection(object):
         self.user = user
         self.password = password
 
+    def get_key(self):
+        """identifies the database in cache keys"""
+        return '%s:%s/%s' % (self.host, self.port, self.database)
+
 
 class ConnectionPool(object):
     def __init__(self, connection, count=10, lifetime=3600):
@@ -18,8 +22,8 @@ class ConnectionPool(object):
         self.count = count
         self.lifetime = lifetime
 
-    @gen.coroutine
-    def get_db(self, callback=None):
+    @coroutine
+    async def get_db(self):
         raise NotImplementedError('The "get_db" method is not implemented')
 
     def get_db_class(self):
@@ -34,3 +38,21 @@ class Database(object):
         self.connection = connection
         self.is_connected = False
         self.start_time = time.time()
+
+    @coroutine
+    async def begin(self):
+        """returns a database to run statements in a transaction on
+
+        Databases without transactions return themselves so everything still
+        runs, but each statement is written as soon as it runs and commit and
+        rollback do nothing.
+        """
+        return self
+
+    @coroutine
+    async def commit(self):
+        return True
+
+    @coroutine
+    async def rollback(self):
+        return True
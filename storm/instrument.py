@@ -0,0 +1,194 @@
+import json
+import time
+import bisect
+import logging
+import functools
+import contextvars
+
+logger = logging.getLogger('storm.slow')
+
+_before_hooks = []
+_after_hooks = []
+
+# the event for the database operation that is running so the backends can
+# fill in the statement and row count from wherever they work them out
+_current_event = contextvars.ContextVar('storm_event', default=None)
+
+
+class Event(object):
+    """One call to a database operation
+
+    statement is the sql for MySQL or the shape of the filter for MongoDB
+    with the values replaced by "?".  elapsed and rows are set once the
+    operation is done and error if it raised.
+    """
+    __slots__ = ('db', 'table', 'operation', 'statement', 'rows', 'start', 'elapsed', 'error')
+
+    def __init__(self, db, table, operation):
+        self.db = db
+        self.table = table
+        self.operation = operation
+        self.statement = None
+        self.rows = None
+        self.start = None
+        self.elapsed = None
+        self.error = None
+
+
+def add_hook(before=None, after=None):
+    """Adds functions to call with the Event before and after every database
+    operation.  Without any hooks the operations run as if they weren't
+    instrumented."""
+    if before is not None:
+        _before_hooks.append(before)
+
+    if after is not None:
+        _after_hooks.append(after)
+
+
+def remove_hook(before=None, after=None):
+    if before in _before_hooks:
+        _before_hooks.remove(before)
+
+    if after in _after_hooks:
+        _after_hooks.remove(after)
+
+
+def clear_hooks():
+    del(_before_hooks[:])
+    del(_after_hooks[:])
+
+
+def filter_shape(spec):
+    """returns a mongo filter with the values replaced by "?" so filters
+    that only differ by their values look the same"""
+    if isinstance(spec, dict):
+        return dict([(key, filter_shape(value)) for key, value in spec.items()])
+
+    if isinstance(spec, (list, tuple)) and len(spec) > 0 and isinstance(spec[0], dict):
+        return [filter_shape(value) for value in spec]
+
+    return '?'
+
+
+def note(statement=None, rows=None):
+    """Sets the statement and number of rows on the event for the operation
+    that is running.  Does nothing if it isn't being instrumented."""
+    event = _current_event.get()
+    if event is None:
+        return
+
+    if statement is not None:
+        if not isinstance(statement, str):
+            statement = json.dumps(filter_shape(statement), sort_keys=True)
+
+        event.statement = statement
+
+    if rows is not None:
+        event.rows = rows
+
+
+def _call_hooks(hooks, event):
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            logging.getLogger('storm').exception('instrumentation hook failed')
+
+
+def instrumented(operation):
+    """Decorator for the operations on a Database"""
+    def decorator(func):
+        async def run(self, table, *args, **kwargs):
+            event = Event(self, table, operation)
+            _call_hooks(_before_hooks, event)
+
+            token = _current_event.set(event)
+            event.start = time.time()
+            start = time.perf_counter()
+            try:
+                return await func(self, table, *args, **kwargs)
+            except Exception as e:
+                event.error = e
+                raise
+            finally:
+                event.elapsed = time.perf_counter() - start
+                _current_event.reset(token)
+                _call_hooks(_after_hooks, event)
+
+        @functools.wraps(func)
+        def wrapper(self, table, *args, **kwargs):
+            if len(_before_hooks) == 0 and len(_after_hooks) == 0:
+                return func(self, table, *args, **kwargs)
+
+            return run(self, table, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class SlowQueryLog(object):
+    """An after hook that logs every operation that takes longer than
+    threshold seconds
+
+    instrument.add_hook(after=SlowQueryLog(0.1))
+    """
+    def __init__(self, threshold=0.1, log=None):
+        self.threshold = threshold
+        self.log = log or logger
+
+    def __call__(self, event):
+        if event.elapsed < self.threshold:
+            return
+
+        self.log.warning('slow %s on %s took %.3fs rows=%s: %s',
+                         event.operation, event.table, event.elapsed,
+                         event.rows, event.statement)
+
+
+class LatencyHistograms(object):
+    """An after hook that counts how long the operations on each table take
+
+    histograms = LatencyHistograms()
+    instrument.add_hook(after=histograms)
+    print(histograms.export())
+
+    buckets are the upper bounds in seconds, anything slower than the last
+    one is counted under "+inf".
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}
+
+    def __call__(self, event):
+        key = (event.table, event.operation)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [0.0, 0, 0, [0] * (len(self.buckets) + 1)]
+
+        histogram[0] += event.elapsed
+        histogram[1] += 1
+        if event.error is not None:
+            histogram[2] += 1
+
+        histogram[3][bisect.bisect_left(self.buckets, event.elapsed)] += 1
+
+    def export(self):
+        """returns {table: {operation: {count, errors, sum, buckets}}}"""
+        data = {}
+        labels = [str(bucket) for bucket in self.buckets] + ['+inf']
+        for (table, operation), (total, count, errors, counts) in self._histograms.items():
+            data.setdefault(table, {})[operation] = {
+                'count': count,
+                'errors': errors,
+                'sum': total,
+                'buckets': dict(zip(labels, counts))
+            }
+
+        return data
+
+    def clear(self):
+        self._histograms = {}
@@ -1,17 +1,99 @@
-import inspect
 import json
+import asyncio
+from storm import codec, context
+from storm.compat import coroutine, maybe_await
 from storm.db import Database, ConnectionPool
 from storm.error import StormError
-from tornado import gen
-from tornado.web import RequestHandler
-from storm.collection import Collection
+from storm.cache import Cache, count_cache
+from storm.collection import Collection, ColumnCollection, ResultIterator, encode_cursor, decode_cursor
+from storm.collection import rows_to_tuples, rows_to_columns
+from storm.collection import COUNT_EXACT, get_count_policy
+
+# (class, is mongodb) => the function that turns rows into objects of that
+# class, see Model._get_converter
+_converters = {}
+
+# table => {key: future} for the queries that are running so identical ones
+# can wait for them instead of running again, see _single_flight
+_in_flight = {}
+
+
+async def _single_flight(table, key, fetch):
+    """runs fetch once for all of the callers that ask for the same key at
+    the same time.  they all get its result or its exception
+
+    fetch runs in its own task so cancelling one of the callers, even the
+    one that started it, doesn't cancel it for the others"""
+    tasks = _in_flight.setdefault(table, {})
+    task = tasks.get(key)
+    if task is None:
+        task = tasks[key] = asyncio.ensure_future(fetch())
+
+        def done(task):
+            if tasks.get(key) is task:
+                del(tasks[key])
+
+            # nobody might be waiting so mark the exception as seen
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(done)
+
+    return await asyncio.shield(task)
+
+
+def _forget_in_flight(table):
+    """called once a write to table is done.  the queries for it that are
+    still running might have started before the write so nothing after it
+    waits for them"""
+    _in_flight.pop(table, None)
+
+
+def _read_key(db):
+    """identifies where reads on db go for the coalescing keys.  a database
+    that routes reads, like storm.routing.RoutedDatabase, adds where it
+    sends them for the current scope"""
+    get_read_key = getattr(db, 'get_read_key', None)
+    return (id(db), get_read_key() if get_read_key is not None else None)
+
+
+def _database_key(db):
+    """identifies the database behind db in cache keys"""
+    connection = getattr(db, 'connection', None)
+    return connection.get_key() if connection is not None else None
+
 
 class Model(object):
     TYPE_MONGO_DB = 'mongodb'
     TYPE_MYSQL = 'mysql'
     db = None
+
+    # no longer supported, see storm.context.RequestScopeMixin
     check_for_handler = False
 
+    # how many after_load hooks find_all runs at the same time
+    _after_load_concurrency = 10
+
+    # name => storm.relation.Relation for the relations that find_all can
+    # load with include=[name, ...]
+    _relations = {}
+
+    # concurrent calls to find with the same arguments share one query.  by
+    # default each caller still gets its own object, set _coalesce_shared to
+    # hand all of them the same one
+    _coalesce_finds = True
+    _coalesce_shared = False
+
+    # subclasses still get a __dict__, this only makes it possible for
+    # DeclaredModel to store its fields in slots
+    __slots__ = ()
+
+    # {field: string} for the json fields that came from the database
+    _raw_json = None
+
+    # the fields that were loaded for objects found with fields or exclude
+    _partial = None
+
     def __init__(self):
         self._type = type(self).__name__.lower()
         self._changes = []
@@ -32,15 +114,61 @@ class Model(object):
 
         if name in self.__dict__:
             old_value = self.__dict__[name]
-            if value != old_value:
+            if value != old_value and name not in self._changes:
                 self._changes.append(name)
 
             self.__dict__[name] = value
             return
 
-        self._changes.append(name)
+        if name not in self._changes:
+            self._changes.append(name)
+
         self.__dict__[name] = value
 
+    def __delattr__(self, name):
+        raw = self._raw_json
+        if raw is not None and name in raw:
+            del(raw[name])
+            self.__dict__.pop(name, None)
+        else:
+            del(self.__dict__[name])
+
+        # the field gets removed from the database on the next save
+        if name[0] != '_' and name not in self._changes:
+            self._changes.append(name)
+
+    def _reset_changes(self):
+        self._changes = []
+
+    def _get_data(self):
+        """returns a dictionary of the public fields that are set"""
+        return dict([(key, self.__dict__[key]) for key in self.__dict__
+                     if not key[0] == '_' and key not in self._relations])
+
+    def _set_relation(self, name, value):
+        # related objects are not fields so they don't count as changes
+        self.__dict__[name] = value
+
+    def is_partial(self):
+        """returns True if the object was found with fields or exclude"""
+        return getattr(self, '_partial', None) is not None
+
+    def _decode_json(self):
+        """decodes the json fields that haven't been read yet"""
+        raw = getattr(self, '_raw_json', None)
+        if raw is None:
+            return
+
+        for name in list(raw):
+            getattr(self, name, None)
+
+        # nothing is left to save without encoding it again
+        object.__delattr__(self, '_raw_json')
+
+    def _as_dict(self):
+        self._decode_json()
+        return self.__dict__
+
     @staticmethod
     def set_db(database):
         if (not isinstance(database, Database) and
@@ -55,38 +183,35 @@ class Model(object):
             Model.get_database_type() == Model.TYPE_MYSQL):
             Model._primary_key = 'id'
 
+        # the converters depend on the primary key so they are built again
+        _converters.clear()
+
+    @staticmethod
+    @coroutine
+    async def get_db():
+        # a db bound to the current request (see storm.context) takes
+        # priority over the global one
+        db = Model._get_db_source()
+
+        if isinstance(db, ConnectionPool):
+            db = await db.get_db()
+
+        return db
+
     @staticmethod
-    @gen.coroutine
-    def get_db(callback=None):
+    def _get_db_source():
+        # this used to look through the stack for a RequestHandler.  raise
+        # instead of quietly using Model.db for requests that expect their
+        # own db
         if Model.check_for_handler:
+            raise StormError('Model.check_for_handler is no longer supported, '
+                             'use storm.context.RequestScopeMixin to bind the db of a request')
 
-            # loop over where this came from and if it came from an instance of
-            # tornado.web.RequestHandler that has a db property on it then use
-            # that.  this isn't really great, but it is a huge convenience to
-            # be able to tie a db connection to a request if you want
-            for trace in inspect.stack()[3:]:
-                local_vars = trace[0].f_locals
-                instance = local_vars.get('self', None)
-                if instance and isinstance(instance, RequestHandler) and hasattr(instance, 'db'):
-                    if callback is not None:
-                        callback(instance.db)
-                        return
-
-                    raise gen.Return(instance.db)
-
-        if isinstance(Model.db, ConnectionPool):
-            db = yield Model.db.get_db()
-            if callback is not None:
-                callback(db)
-                return
-
-            raise gen.Return(db)
-
-        if callback is not None:
-            callback(Model.db)
-            return
+        db = context.bound_db()
+        if db is None:
+            return Model.db
 
-        raise gen.Return(Model.db)
+        return db
 
     @classmethod
     def get_table(class_name):
@@ -98,65 +223,301 @@ class Model(object):
 
     @staticmethod
     def get_database_type(db_object=None):
-        name = type(Model.db) if db_object is None else type(db_object)
-        if db_object is None and isinstance(Model.db, ConnectionPool):
-            name = Model.db.get_db_class()
+        if db_object is None:
+            db_object = Model._get_db_source()
+
+        name = type(db_object)
+        if isinstance(db_object, ConnectionPool):
+            name = db_object.get_db_class()
 
         return name.__name__.lower()
 
-    @gen.coroutine
-    def before_save(self, changes):
+    @coroutine
+    async def before_save(self, changes):
         pass
 
-    @gen.coroutine
-    def after_save(self, changes):
+    @coroutine
+    async def after_save(self, changes):
         pass
 
-    @gen.coroutine
-    def after_load(self):
+    @coroutine
+    async def after_load(self):
         pass
 
+    @classmethod
+    @coroutine
+    async def after_load_many(class_name, objects):
+        """Called with every object that find or find_all loads
+
+        By default this runs after_load for the objects, up to
+        _after_load_concurrency at a time.  Override it to load related
+        data for all of the objects at once.
+        """
+        if getattr(class_name.after_load, '__func__', class_name.after_load) is _default_after_load:
+            return
+
+        pending = iter(objects)
+
+        # each worker takes the next object as soon as it is done with the
+        # last one so there are never more than the limit running
+        async def worker():
+            for obj in pending:
+                await maybe_await(obj.after_load())
+
+        limit = max(1, class_name._after_load_concurrency)
+        await asyncio.gather(*[worker() for i in range(min(limit, len(objects)))])
+
     @classmethod
     def _convert_object(class_name, obj):
-        return_obj = class_name()
+        return class_name._get_default_converter()(obj)
+
+    @classmethod
+    def _get_converter(class_name):
+        """returns a function that turns a row into an object
 
-        # set all properties
-        for key in obj:
-            if key in return_obj._json_fields:
-                try:
-                    obj[key] = json.loads(obj[key])
-                except:
-                    obj[key] = {}
+        Everything that is the same for every row is worked out once per
+        class instead of for every row.
+        """
+        # a class with its own _convert_object keeps using it
+        if getattr(class_name._convert_object, '__func__', None) is not _default_convert_object:
+            return class_name._convert_object
 
-            setattr(return_obj, key, obj[key])
+        return class_name._get_default_converter()
 
-        # make sure the primary key is set to a string
-        # for mongodb
-        if Model.get_database_type() == Model.TYPE_MONGO_DB:
-            setattr(return_obj, return_obj._primary_key,
-                    str(getattr(return_obj, return_obj._primary_key)))
+    @classmethod
+    def _get_default_converter(class_name):
+        # an override of _convert_object can call this one through super so
+        # this can't check for the override again
+        is_mongo = Model.get_database_type() == Model.TYPE_MONGO_DB
+        convert = _converters.get((class_name, is_mongo))
+        if convert is None:
+            convert = _converters[(class_name, is_mongo)] = class_name._make_converter(is_mongo)
 
-        # reset changes
-        return_obj._changes = []
+        return convert
 
-        return return_obj
+    @classmethod
+    def _make_converter(class_name, is_mongo):
+        # __init__ and __setattr__ have to run if the class changed them
+        if class_name.__init__ is not Model.__init__ or class_name.__setattr__ is not Model.__setattr__:
+            def convert(obj):
+                return_obj = class_name()
+
+                # set all properties.  json fields are kept as they are
+                # until they are read
+                raw = None
+                for key in obj:
+                    if key in return_obj._json_fields and class_name._is_lazy_json(key):
+                        if raw is None:
+                            raw = {}
+
+                        raw[key] = obj[key]
+                        return_obj.__dict__.pop(key, None)
+                        continue
+
+                    setattr(return_obj, key, obj[key])
+
+                if raw is not None:
+                    return_obj.__dict__['_raw_json'] = raw
+
+                # make sure the primary key is set to a string
+                # for mongodb
+                if is_mongo:
+                    setattr(return_obj, return_obj._primary_key,
+                            str(getattr(return_obj, return_obj._primary_key)))
+
+                return_obj._reset_changes()
+                return return_obj
+
+            return convert
+
+        # otherwise the object is built without calling either of them.  this
+        # is what __init__ would set on it
+        state = {'_type': class_name.__name__.lower()}
+        if not hasattr(class_name, '_table'):
+            state['_table'] = state['_type']
+
+        if not hasattr(class_name, '_primary_key'):
+            state['_primary_key'] = '_id'
+
+        needs_json_fields = not hasattr(class_name, '_json_fields')
+        json_fields = getattr(class_name, '_json_fields', ())
+        lazy_fields = [key for key in json_fields if class_name._is_lazy_json(key)]
+        eager_fields = [key for key in json_fields if key not in lazy_fields]
+        primary_key = getattr(class_name, '_primary_key', '_id')
+        new = object.__new__
+
+        def convert(obj):
+            return_obj = new(class_name)
+            values = return_obj.__dict__
+            values.update(state)
+            values['_changes'] = []
+            if needs_json_fields:
+                values['_json_fields'] = []
+
+            values.update(obj)
+
+            # json fields are decoded the first time they are read
+            raw = None
+            for key in lazy_fields:
+                if key in obj:
+                    if raw is None:
+                        raw = values['_raw_json'] = {}
+
+                    raw[key] = values.pop(key)
+
+            for key in eager_fields:
+                if key in obj:
+                    values[key] = _load_json(obj[key])
+
+            if is_mongo:
+                values[primary_key] = str(values[primary_key])
+
+            return return_obj
+
+        return convert
 
     @classmethod
-    @gen.coroutine
-    def find_all(class_name, data, **args):
-        table = getattr(class_name, 'get_table')()
+    def _is_lazy_json(class_name, name):
+        """puts a _JsonField on the class so the json field called name is
+        decoded the first time it is read.  fields with a default set on
+        the class are decoded when the row is converted instead"""
+        value = getattr(class_name, name, None)
+        if isinstance(value, _JsonField):
+            return True
+
+        if hasattr(class_name, name):
+            return False
+
+        setattr(class_name, name, _JsonField(name))
+        return True
+
+    @classmethod
+    @coroutine
+    async def _load_objects(class_name, rows, partial=False):
+        """converts rows into objects and runs their after_load hooks.
+        partial objects only have some of their fields so they are never
+        put in the identity map"""
+        identity_map = context.identity_map()
+
+        # build all of the objects first so the after_load hooks can run
+        # for all of them at once
+        loaded = []
+        new_objects = []
+        convert = class_name._get_converter()
+        for row in rows:
+            new_obj = None
+            if identity_map is not None:
+                new_obj = identity_map.get(class_name, class_name._get_row_id(row))
+
+            if new_obj is None:
+                new_obj = convert(row)
+                new_objects.append(new_obj)
+
+                if partial:
+                    object.__setattr__(new_obj, '_partial', frozenset(row))
+                elif identity_map is not None:
+                    identity_map.add(new_obj)
+
+            loaded.append(new_obj)
+
+        if len(new_objects) > 0:
+            await maybe_await(class_name.after_load_many(new_objects))
+
+        return loaded
+
+    @classmethod
+    @coroutine
+    async def _include(class_name, name, objects):
+        if name not in class_name._relations:
+            raise StormError('%s has no relation named %s' % (class_name.__name__, name))
 
-        callback = None
-        if 'callback' in args:
-            callback = args['callback']
-            del(args['callback'])
+        relation = class_name._relations[name]
+        related_class = relation.get_model()
+        local_key, remote_key = relation.get_keys(class_name)
 
-        db = yield Model.get_db()
-        objects, total_count = yield db.select_multiple(table, data, **args)
+        values = {}
+        for obj in objects:
+            value = getattr(obj, local_key, None)
+            if value is not None:
+                values[str(value)] = value
+
+        related = {}
+        if len(values) > 0:
+            db = await Model.get_db()
+            rows = await db.select_in(related_class.get_table(), remote_key, list(values.values()))
+            for related_obj in (await related_class._load_objects(rows)):
+                related.setdefault(str(getattr(related_obj, remote_key)), []).append(related_obj)
+
+        for obj in objects:
+            matches = related.get(str(getattr(obj, local_key, None)), [])
+            if relation.many:
+                obj._set_relation(name, matches)
+            else:
+                obj._set_relation(name, matches[0] if len(matches) > 0 else None)
+
+    @classmethod
+    def _get_projection(class_name, args):
+        """takes fields and exclude out of args and returns them as the
+        arguments for the database.  the primary key is always loaded"""
+        fields = args.pop('fields', None)
+        exclude = args.pop('exclude', None)
+        if fields is not None and exclude is not None:
+            raise StormError('only one of fields and exclude can be used')
+
+        primary_key = getattr(class_name, '_primary_key', '_id')
+        primary_key = primary_key if isinstance(primary_key, list) else [primary_key]
+
+        projection = {}
+        if fields is not None:
+            projection['fields'] = list(fields) + [key for key in primary_key if key not in fields]
+
+        if exclude is not None:
+            exclude = [field for field in exclude if field not in primary_key]
+            if len(exclude) > 0:
+                projection['exclude'] = exclude
+
+        return projection
+
+    @classmethod
+    @coroutine
+    async def find_all(class_name, data, **args):
+        table = getattr(class_name, 'get_table')()
+
+        # fields or exclude only load some of the fields
+        projection = class_name._get_projection(args)
+        args.update(projection)
+
+        # passing after (even as None for the first page) switches to keyset
+        # pagination where each page starts from the sort values of the last
+        # object on the previous one instead of skipping over rows
+        keyset = 'after' in args
+        if keyset:
+            args = class_name._get_keyset_args(args)
+        elif 'page' in args:
+            args['count'] = get_count_policy(args.get('count', COUNT_EXACT))
+
+        # coalesce=True shares one query between identical calls that are
+        # running at the same time
+        coalesce = args.pop('coalesce', False)
+
+        # the raw modes return the rows without building objects
+        as_raw = args.get('as_raw', False)
+        as_tuples = args.get('as_tuples', False)
+        as_columns = args.get('as_columns', False)
+        if (as_raw or as_tuples or as_columns) and len(args.get('include', ())) > 0:
+            raise StormError('relations can only be included when loading objects')
+
+        db = await Model.get_db()
+        if coalesce:
+            key = (_read_key(db), class_name, class_name._get_query_key(data), json.dumps(sorted(args.items()), default=str))
+            objects, total_count = await _single_flight(table, key, lambda: db.select_multiple(table, data, **args))
+            objects = [dict(row) for row in objects]
+        else:
+            objects, total_count = await db.select_multiple(table, data, **args)
 
         as_dict = args.get('as_dict', False)
 
-        collection = Collection()
+        collection = ColumnCollection() if as_columns else Collection()
 
         if 'page' in args:
             collection.page = args['page']
@@ -164,54 +525,268 @@ class Model(object):
 
         collection.total_count = total_count
 
-        for obj in objects:
-            new_obj = getattr(class_name, '_convert_object')(obj)
-            yield new_obj.after_load()
-            collection.append(new_obj if not as_dict else new_obj.__dict__)
+        if keyset:
+            collection.page_size = args['page_size']
+
+        # without an exact count the backend fetches one extra row to tell
+        # if there is a next page
+        if keyset or ('page' in args and args['count'] != COUNT_EXACT):
+            collection.has_more = len(objects) > collection.page_size
+            if collection.has_more:
+                objects = objects[:collection.page_size]
 
-        if callback is None:
-            raise gen.Return(collection)
+                if keyset:
+                    last = objects[-1]
+                    collection.next_cursor = encode_cursor([last.get(field) for field in args['keyset_fields']])
 
-        callback(collection)
+        if as_raw:
+            collection.extend(objects)
+            return collection
+
+        if as_tuples:
+            collection.columns, rows = rows_to_tuples(objects)
+            collection.extend(rows)
+            return collection
+
+        if as_columns:
+            collection.update(rows_to_columns(objects, use_numpy=as_columns != 'list'))
+            return collection
+
+        loaded = await class_name._load_objects(objects, partial=len(projection) > 0)
+
+        # load each relation for the whole page with one query
+        for name in args.get('include', ()):
+            await class_name._include(name, loaded)
+
+        for new_obj in loaded:
+            collection.append(new_obj if not as_dict else new_obj._as_dict())
+
+        return collection
+
+    @staticmethod
+    def _get_query_key(data):
+        if hasattr(data, 'get_key'):
+            return data.get_key()
+
+        return json.dumps(data, sort_keys=True, default=str)
+
+    @classmethod
+    def _get_keyset_args(class_name, args):
+        args = dict(args)
+
+        primary_key = getattr(class_name, '_primary_key', '_id')
+        if isinstance(primary_key, list):
+            raise StormError('keyset pagination does not support compound primary keys')
+
+        # keyset pagination needs a unique order so the primary key is always
+        # used to break ties between objects with the same sort value
+        sort = args.get('sort') or [(primary_key, -1)]
+        field, direction = sort[0]
+        fields = [field] if field == primary_key else [field, primary_key]
+        args['sort'] = [(key, direction) for key in fields]
+
+        after = args['after']
+        if after is not None:
+            after = decode_cursor(after)
+            if len(after) != len(fields):
+                raise StormError('cursor does not match sort: %s' % args['after'])
+
+        args.pop('page', None)
+        args['after'] = after
+        args['keyset_fields'] = fields
+        args['page_size'] = args.get('page_size', 10)
+        args['count'] = get_count_policy(args.get('count', False))
+        return args
+
+    @classmethod
+    def iter_all(class_name, data, batch_size=500):
+        """Returns a ResultIterator that loads the objects batch_size at a
+        time so memory use stays the same no matter how many there are"""
+        return ResultIterator(class_name, data, batch_size)
 
     @classmethod
-    @gen.coroutine
-    def find(class_name, **args):
+    @coroutine
+    async def _select_iter(class_name, data, batch_size):
         table = getattr(class_name, 'get_table')()
+        db = await Model.get_db()
+        stream = await db.select_iter(table, data, batch_size)
+        return stream
 
-        callback = None
-        if 'callback' in args:
-            callback = args['callback']
-            del(args['callback'])
+    @classmethod
+    @coroutine
+    async def find(class_name, **args):
+        table = getattr(class_name, 'get_table')()
+        projection = class_name._get_projection(args)
+
+        # objects that were already loaded in this scope are used as is
+        identity_map = context.identity_map()
+        if identity_map is not None:
+            row_id = class_name._get_primary_key_lookup(args)
+            if row_id is not None:
+                return_obj = identity_map.get(class_name, row_id)
+                if return_obj is not None:
+                    return return_obj
+
+        # read through the cache for the class if it has one
+        db = await Model.get_db()
+        cache = getattr(class_name, '_cache', None)
+        obj = None
+        if cache is not None:
+            obj = await cache.get_row(table, args, _database_key(db))
+
+        if obj is None:
+            # partial rows are not cached or shared with other finds
+            if len(projection) > 0:
+                row = await db.select_one(table, **dict(args, **projection))
+                return_obj = await class_name._get_object(row, identity_map, partial=True)
+                return return_obj
+
+            # concurrent finds for the same thing share a single query
+            if class_name._coalesce_finds:
+                key = (_read_key(db), class_name, Cache.make_key(table, args))
+
+                if class_name._coalesce_shared:
+                    return_obj = await _single_flight(table, key, lambda: class_name._fetch_object(db, table, args, cache, identity_map))
+                    if identity_map is not None:
+                        return_obj = identity_map.add(return_obj)
+
+                    return return_obj
+
+                # everyone gets their own copy of the row because converting
+                # it changes it
+                obj = await _single_flight(table, key, lambda: class_name._fetch_row(db, table, args, cache))
+                obj = dict(obj)
+            else:
+                obj = await class_name._fetch_row(db, table, args, cache)
+
+        return_obj = await class_name._get_object(obj, identity_map)
 
-        db = yield Model.get_db()
-        obj = yield db.select_one(table, **args)
+        return return_obj
 
-        return_obj = None
-        if obj is not None:
-            return_obj = getattr(class_name, '_convert_object')(obj)
-            yield return_obj.after_load()
+    @classmethod
+    @coroutine
+    async def _fetch_row(class_name, db, table, args, cache):
+        row = await db.select_one(table, **args)
 
-        if callback is None:
-            raise gen.Return(return_obj)
+        if cache is not None:
+            await cache.set_row(table, args, class_name._get_row_id(row), row, _database_key(db))
 
-        callback(return_obj)
+        return row
 
-    @gen.coroutine
-    def save(self, callback=None):
-        yield self.before_save(self._changes)
+    @classmethod
+    @coroutine
+    async def _fetch_object(class_name, db, table, args, cache, identity_map):
+        row = await class_name._fetch_row(db, table, args, cache)
+        obj = await class_name._get_object(dict(row), identity_map)
+        return obj
+
+    @classmethod
+    @coroutine
+    async def _get_object(class_name, row, identity_map, partial=False):
+        existing = None
+        if identity_map is not None:
+            existing = identity_map.get(class_name, class_name._get_row_id(row))
 
-        to_save = {}
-        for k in [key for key in self.__dict__ if not key[0] == '_']:
-            val = self.__dict__[k]
-            if k in self._json_fields:
-                try:
-                    val = json.dumps(val)
-                except:
-                    pass
+        if existing is not None:
+            return existing
+
+        obj = getattr(class_name, '_convert_object')(row)
+        if partial:
+            object.__setattr__(obj, '_partial', frozenset(row))
+
+        await maybe_await(class_name.after_load_many([obj]))
+
+        if identity_map is not None and not partial:
+            identity_map.add(obj)
+
+        return obj
+
+    @classmethod
+    def _get_row_id(class_name, row):
+        primary_key = getattr(class_name, '_primary_key', '_id')
+        if isinstance(primary_key, list):
+            return tuple([str(row.get(key)) for key in primary_key])
 
-            to_save[k] = val
+        return str(row.get(primary_key))
 
+    @coroutine
+    async def _invalidate_cache(self):
+        cache = getattr(type(self), '_cache', None)
+        if cache is None:
+            return
+
+        db = await Model.get_db()
+        lookup = self._get_primary_key_values()
+        await cache.invalidate(self._table, type(self)._get_row_id(lookup), lookup, _database_key(db))
+
+    def _get_primary_key_values(self):
+        primary_key_fields = self._primary_key
+        if not isinstance(primary_key_fields, list):
+            primary_key_fields = [primary_key_fields]
+
+        return dict([(key, getattr(self, key, None)) for key in primary_key_fields])
+
+    @classmethod
+    def _get_primary_key_lookup(class_name, args):
+        """returns the row id if args are a lookup by primary key"""
+        primary_key = getattr(class_name, '_primary_key', '_id')
+        if isinstance(primary_key, list):
+            if len(args) != len(primary_key) or not all([key in args for key in primary_key]):
+                return None
+        elif len(args) != 1 or primary_key not in args:
+            return None
+
+        return class_name._get_row_id(args)
+
+    def _get_save_data(self):
+        to_save = self._get_data()
+        raw = getattr(self, '_raw_json', None)
+        needs_insert = None
+
+        # an object that was found with fields or exclude only writes the
+        # fields it has.  a change to a field that isn't there would set the
+        # column to null so those are dropped unless the field was loaded
+        # and then deleted
+        partial = getattr(self, '_partial', None)
+        if partial is not None:
+            needs_insert = self._needs_insert()[0]
+            if needs_insert:
+                raise StormError('%s was only partly loaded so it can not be inserted' % type(self).__name__)
+
+            for k in list(self._changes):
+                if k not in to_save and k not in partial:
+                    self._changes.remove(k)
+
+        for k in self._json_fields:
+            if k not in to_save:
+                # never read so it is saved as it came from the database
+                if raw is not None and k in raw:
+                    to_save[k] = raw[k]
+
+                continue
+
+            # fields that were read but not changed aren't written by an
+            # update so there is no need to encode them again
+            if raw is not None and k in raw and k not in self._changes:
+                if needs_insert is None:
+                    needs_insert = self._needs_insert()[0]
+
+                if not needs_insert:
+                    to_save[k] = raw[k]
+                    continue
+
+            try:
+                to_save[k] = codec.dumps(to_save[k])
+            except:
+                continue
+
+            if raw is not None and k in raw:
+                raw[k] = to_save[k]
+
+        return to_save
+
+    def _needs_insert(self):
+        """returns a tuple of (needs insert, primary key not included)"""
         is_compound_primary_key = isinstance(self._primary_key, list)
         primary_key_not_included = not is_compound_primary_key and not hasattr(self, self._primary_key)
         primary_key_was_set = self._primary_key in self._changes
@@ -223,9 +798,19 @@ class Model(object):
                     primary_key_was_set = False
                     break
 
-        if primary_key_not_included or primary_key_was_set:
-            db = yield Model.get_db()
-            result = yield db.insert(self._table, to_save)
+        return (primary_key_not_included or primary_key_was_set,
+                primary_key_not_included)
+
+    @coroutine
+    async def save(self):
+        await maybe_await(self.before_save(self._changes))
+
+        to_save = self._get_save_data()
+        needs_insert, primary_key_not_included = self._needs_insert()
+
+        if needs_insert:
+            db = await Model.get_db()
+            result = await db.insert(self._table, to_save)
 
             if Model.get_database_type() == Model.TYPE_MONGO_DB:
                 result = str(result)
@@ -237,22 +822,139 @@ class Model(object):
             # I do not remember why this is here, but I think it might be for
             # mongodb where the primary key starts with an underscore and
             # therefore won't be included in the to_save dictionary
-            if not is_compound_primary_key:
-                to_save[self._primary_key] = self.__dict__[self._primary_key]
+            if not isinstance(self._primary_key, list):
+                to_save[self._primary_key] = getattr(self, self._primary_key)
 
-            db = yield Model.get_db()
-            result = yield db.update(self._table, to_save, self._changes, self._primary_key)
+            db = await Model.get_db()
+            result = await db.update(self._table, to_save, self._changes, self._primary_key)
 
-        yield self.after_save(self._changes)
-        self._changes = []
+        count_cache.invalidate(self._table)
+        _forget_in_flight(self._table)
+        await self._invalidate_cache()
+
+        identity_map = context.identity_map()
+        if identity_map is not None and getattr(self, '_partial', None) is None:
+            identity_map.replace(self)
+
+        await maybe_await(self.after_save(self._changes))
+        self._reset_changes()
+
+        return result
+
+    @classmethod
+    @coroutine
+    async def save_many(class_name, objects, chunk_size=500):
+        """Saves a list of objects using as few round trips as possible
+
+        New objects are written with batch inserts of up to chunk_size rows
+        and get their generated primary keys assigned.  Objects that already
+        exist are updated one at a time the same way save would.  Returns a
+        list with the save result for each object.
+        """
+        objects = list(objects)
+        await asyncio.gather(*[maybe_await(obj.before_save(obj._changes)) for obj in objects])
+
+        db = await Model.get_db()
+        results = await class_name._write_many(db, objects, chunk_size)
+        await class_name._after_save_many(objects)
+
+        return results
+
+    @staticmethod
+    @coroutine
+    async def _write_many(db, objects, chunk_size=500):
+        """writes the objects to db and returns the result for each one"""
+        is_mongo = Model.get_database_type() == Model.TYPE_MONGO_DB
+
+        results = [None] * len(objects)
+        to_insert = {}
+        for i, obj in enumerate(objects):
+            to_save = obj._get_save_data()
+            needs_insert, primary_key_not_included = obj._needs_insert()
+
+            if needs_insert:
+                to_insert.setdefault(obj._table, []).append((i, to_save, primary_key_not_included))
+                continue
+
+            if not isinstance(obj._primary_key, list):
+                to_save[obj._primary_key] = getattr(obj, obj._primary_key)
+
+            results[i] = await db.update(obj._table, to_save, obj._changes, obj._primary_key)
+
+        for table in to_insert:
+            rows = to_insert[table]
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                primary_key = objects[chunk[0][0]]._primary_key
+                if not isinstance(primary_key, str):
+                    primary_key = None
+
+                ids = await db.insert_many(table, [row[1] for row in chunk], primary_key)
 
-        if callback is None:
-            raise gen.Return(result)
+                for (i, to_save, primary_key_not_included), result in zip(chunk, ids):
+                    if is_mongo:
+                        result = str(result)
 
-        callback(result)
+                    results[i] = result
+                    if primary_key_not_included:
+                        obj = objects[i]
+                        setattr(obj, obj._primary_key, result)
 
-    @gen.coroutine
-    def delete(self, callback=None):
+        return results
+
+    @staticmethod
+    @coroutine
+    async def _after_save_many(objects):
+        for table in set([obj._table for obj in objects]):
+            count_cache.invalidate(table)
+            _forget_in_flight(table)
+
+        await asyncio.gather(*[obj._invalidate_cache() for obj in objects])
+
+        identity_map = context.identity_map()
+        if identity_map is not None:
+            for obj in objects:
+                if getattr(obj, '_partial', None) is None:
+                    identity_map.replace(obj)
+
+        await asyncio.gather(*[maybe_await(obj.after_save(obj._changes)) for obj in objects])
+        for obj in objects:
+            obj._reset_changes()
+
+    @staticmethod
+    @coroutine
+    async def _delete_many(db, objects):
+        """deletes the objects from db with one statement per table where
+        the primary key isn't compound"""
+        by_table = {}
+        for obj in objects:
+            if isinstance(obj._primary_key, list):
+                await db.delete(obj._table, obj._primary_key,
+                                [getattr(obj, key) for key in obj._primary_key])
+                continue
+
+            if hasattr(obj, obj._primary_key):
+                by_table.setdefault((obj._table, obj._primary_key), []).append(getattr(obj, obj._primary_key))
+
+        for table, primary_key in by_table:
+            await db.delete_many(table, primary_key, by_table[(table, primary_key)])
+
+    @staticmethod
+    @coroutine
+    async def _after_delete_many(objects):
+        for table in set([obj._table for obj in objects]):
+            count_cache.invalidate(table)
+            _forget_in_flight(table)
+
+        await asyncio.gather(*[obj._invalidate_cache() for obj in objects])
+
+        identity_map = context.identity_map()
+        if identity_map is not None:
+            for obj in objects:
+                identity_map.remove(obj)
+
+    @coroutine
+    async def delete(self):
         result = False
 
         is_compound_primary_key = isinstance(self._primary_key, list)
@@ -266,12 +968,270 @@ class Model(object):
             for key in primary_key_fields:
                 primary_key_values.append(getattr(self, key))
 
-            db = yield Model.get_db()
-            result = yield db.delete(self._table,
+            db = await Model.get_db()
+            result = await db.delete(self._table,
                                      primary_key_fields,
                                      primary_key_values)
 
-        if callback is None:
-            raise gen.Return(result)
+            count_cache.invalidate(self._table)
+            _forget_in_flight(self._table)
+            await self._invalidate_cache()
+
+            identity_map = context.identity_map()
+            if identity_map is not None:
+                identity_map.remove(self)
+
+        return result
+
+
+_default_after_load = getattr(Model.after_load, '__func__', Model.after_load)
+_default_convert_object = Model._convert_object.__func__
+
+
+def _load_json(value):
+    try:
+        return codec.loads(value)
+    except:
+        return {}
+
+
+class _JsonField(object):
+    """Decodes a json field from the string it came from the database as
+    the first time it is read.  the value is stored on the object so later
+    reads don't come here"""
+    def __init__(self, name):
+        self.name = name
+
+    def _decode(self, obj):
+        raw = getattr(obj, '_raw_json', None)
+        if raw is None or self.name not in raw:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(obj).__name__, self.name))
+
+        return _load_json(raw[self.name])
 
-        callback(result)
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        value = obj.__dict__[self.name] = self._decode(obj)
+        return value
+
+
+class _JsonSlot(_JsonField):
+    """_JsonField for a DeclaredModel where the value goes in the slot"""
+    def __init__(self, name, slot):
+        super(_JsonSlot, self).__init__(name)
+        self.slot = slot
+
+    def peek(self, obj):
+        """returns the value without decoding it"""
+        try:
+            return self.slot.__get__(obj, type(obj))
+        except AttributeError:
+            return _missing
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        try:
+            return self.slot.__get__(obj, cls)
+        except AttributeError:
+            pass
+
+        value = self._decode(obj)
+        self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+    def __delete__(self, obj):
+        self.slot.__delete__(obj)
+
+
+class Changes(set):
+    """The names of the fields that changed on a DeclaredModel
+
+    append is there so it can be used anywhere the list on Model is used.
+    """
+    append = set.add
+
+
+_missing = object()
+
+
+class ModelMeta(type):
+    def __new__(mcs, name, bases, attrs):
+        inherited = ()
+        for base in bases:
+            inherited += getattr(base, '_field_names', ())
+
+        # every declared field gets a slot.  _id is always there so it can
+        # hold the primary key for mongodb
+        # relations need a slot to be attached to the object
+        fields = tuple(attrs.get('_fields', ())) + tuple(attrs.get('_relations', ())) + ('_id',)
+        fields = tuple([field for field in fields if field not in inherited])
+        attrs['__slots__'] = tuple(attrs.get('__slots__', ())) + fields
+        attrs['_field_names'] = inherited + fields
+
+        # per class metadata that Model would otherwise set on each instance
+        attrs.setdefault('_type', name.lower())
+
+        # the table is named after the class unless it comes from a base
+        # class.  DeclaredModel itself doesn't have one
+        if '_table' not in attrs and bases != (Model,) and not any(hasattr(base, '_table') for base in bases):
+            attrs['_table'] = attrs['_type']
+
+        if '_json_fields' in attrs:
+            attrs['_json_fields'] = frozenset(attrs['_json_fields'])
+
+        cls = super(ModelMeta, mcs).__new__(mcs, name, bases, attrs)
+
+        # json fields are decoded the first time they are read
+        for field in attrs.get('_json_fields', ()):
+            slot = getattr(cls, field, None)
+            if slot is not None and not isinstance(slot, _JsonField):
+                setattr(cls, field, _JsonSlot(field, slot))
+
+        return cls
+
+
+class _DefaultPrimaryKey(object):
+    """the primary key of a class that doesn't set one.  it depends on the
+    database so it is looked up each time, like Model does for each object"""
+    def __get__(self, obj, cls):
+        return getattr(Model, '_primary_key', '_id')
+
+
+class DeclaredModel(Model, metaclass=ModelMeta):
+    """A model with a fixed list of fields
+
+    The fields are stored in slots instead of a __dict__ and the changes are
+    tracked in a set which makes instances a lot smaller and faster to update
+    than a regular Model.  Setting a field that is not declared raises an
+    AttributeError.
+
+    class User(DeclaredModel):
+        _fields = ('id', 'name', 'email', 'settings')
+        _json_fields = ('settings',)
+    """
+    __slots__ = ('_changes', '_raw_json', '_partial')
+    _json_fields = frozenset()
+    _primary_key = _DefaultPrimaryKey()
+
+    def __init__(self):
+        self._changes = Changes()
+
+    def __setattr__(self, name, value):
+        if name[0] == '_' and name != '_id':
+            object.__setattr__(self, name, value)
+            return
+
+        old_value = getattr(self, name, _missing)
+        object.__setattr__(self, name, value)
+
+        if name[0] == '_':
+            return
+
+        if old_value is _missing or value != old_value:
+            self._changes.add(name)
+
+    def __delattr__(self, name):
+        raw = getattr(self, '_raw_json', None)
+        if raw is not None and name in raw:
+            del(raw[name])
+            try:
+                object.__delattr__(self, name)
+            except AttributeError:
+                pass
+        else:
+            object.__delattr__(self, name)
+
+        if name[0] != '_':
+            self._changes.add(name)
+
+    def _reset_changes(self):
+        self._changes = Changes()
+
+    def _get_data(self):
+        data = {}
+        raw = getattr(self, '_raw_json', None)
+        for key in self._field_names:
+            if key[0] == '_' or key in self._relations:
+                continue
+
+            # json fields that haven't been read are left out
+            if raw is not None and key in raw:
+                value = getattr(type(self), key).peek(self)
+            else:
+                value = getattr(self, key, _missing)
+
+            if value is not _missing:
+                data[key] = value
+
+        return data
+
+    def _as_dict(self):
+        self._decode_json()
+        data = self._get_data()
+        if hasattr(self, '_id'):
+            data['_id'] = self._id
+
+        for name in self._relations:
+            if hasattr(self, name):
+                data[name] = getattr(self, name)
+
+        return data
+
+    def _set_relation(self, name, value):
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def _make_converter(class_name, is_mongo):
+        # __init__ only has to run if the class changed it.  the fields are
+        # always set with object.__setattr__ so nothing counts as a change
+        custom_init = class_name.__init__ is not DeclaredModel.__init__
+        field_names = frozenset(class_name._field_names)
+        json_fields = class_name._json_fields
+        primary_key = class_name._primary_key
+        new = object.__new__
+        set_value = object.__setattr__
+
+        def convert(obj):
+            if custom_init:
+                return_obj = class_name()
+            else:
+                return_obj = new(class_name)
+                set_value(return_obj, '_changes', Changes())
+
+            # columns that were not declared are left out and json fields
+            # are decoded the first time they are read
+            raw = None
+            for key in obj:
+                if key not in field_names:
+                    continue
+
+                if key in json_fields:
+                    if raw is None:
+                        raw = {}
+
+                    raw[key] = obj[key]
+                    if custom_init and hasattr(return_obj, key):
+                        object.__delattr__(return_obj, key)
+
+                    continue
+
+                set_value(return_obj, key, obj[key])
+
+            if raw is not None:
+                set_value(return_obj, '_raw_json', raw)
+
+            # make sure the primary key is set to a string
+            # for mongodb
+            if is_mongo:
+                set_value(return_obj, primary_key, str(getattr(return_obj, primary_key)))
+
+            return return_obj
+
+        return convert
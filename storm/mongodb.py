@@ -1,110 +1,389 @@
-import motor
-from tornado import gen
+import json
+import time
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from storm.compat import coroutine
+from storm.instrument import instrumented, note
 from bson.objectid import ObjectId
+from storm.cache import count_cache
+from storm.collection import COUNT_EXACT, COUNT_ESTIMATE, COUNT_CACHED
 from storm.db import Database, ConnectionPool
 from storm import error
 
 
 class MongoDb(Database):
-    def connect(self):
+    def __init__(self, connection, max_pool_size=10):
+        super(MongoDb, self).__init__(connection)
+        self.max_pool_size = max_pool_size
+        self.motor_client = None
+        self._connecting = None
+
+    @coroutine
+    async def connect(self):
         if self.is_connected:
-            return
+            return True
 
-        self.motor_client = motor.MotorClient(
-            self.connection.host,
-            self.connection.port
-        ).open_sync()
+        # everything that queries before the first connect is done waits for
+        # the same one
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
 
-        self.db = self.motor_client[self.connection.database]
+        try:
+            await asyncio.shield(self._connecting)
+        except Exception:
+            self._connecting = None
+            raise
+
+        return True
+
+    async def _connect(self):
+        # the client connects in the background on the first query
+        client = AsyncIOMotorClient(self.connection.host,
+                                    self.connection.port,
+                                    maxPoolSize=self.max_pool_size)
+
+        self.motor_client = client
+        self.db = client[self.connection.database]
         self.is_connected = True
 
-    @gen.coroutine
-    def select_one(self, table, **kwargs):
-        self.connect()
+    @coroutine
+    async def ping(self):
+        await self.connect()
+        result = await self.db.command('ping')
+        return result
+
+    @coroutine
+    async def close(self):
+        if self.is_connected:
+            self.motor_client.close()
+            self.is_connected = False
+            self._connecting = None
+
+        return True
+
+    @staticmethod
+    def _projection(fields, exclude):
+        """returns the projection for fields to include or exclude, or None
+        for every field"""
+        if fields is not None:
+            return dict([(field, 1) for field in fields])
+
+        if exclude:
+            return dict([(field, 0) for field in exclude])
+
+        return None
+
+    @coroutine
+    @instrumented('select_one')
+    async def select_one(self, table, fields=None, exclude=None, **kwargs):
+        await self.connect()
 
         if '_id' in kwargs:
             kwargs['_id'] = ObjectId(kwargs['_id'])
 
-        result = yield motor.Op(getattr(self.db, table).find_one, kwargs)
+        args = [kwargs]
+        projection = self._projection(fields, exclude)
+        if projection is not None:
+            args.append(projection)
+
+        result = await self.db[table].find_one(*args)
+        note(kwargs, 0 if result is None else 1)
 
         if result is None:
             raise error.StormNotFoundError("Object of type: %s not found with args: %s" % (table, kwargs))
 
-        callback = kwargs.get('callback')
+        return result
+
+    @coroutine
+    @instrumented('select_multiple')
+    async def select_multiple(self, table, data, **kwargs):
+        await self.connect()
+
+        # keyset pagination, see Model.find_all
+        keyset = 'keyset_fields' in kwargs
+        spec = data
+        query = data
+        if keyset and kwargs['after'] is not None:
+            query = self._keyset_query(data, kwargs['sort'], kwargs['after'])
 
-        if callback is None:
-            raise gen.Return(result)
+        # the keyset cursor needs the sort fields in the documents
+        fields = kwargs.get('fields')
+        exclude = kwargs.get('exclude')
+        if keyset and fields is not None:
+            fields = list(fields) + [field for field in kwargs['keyset_fields'] if field not in fields]
+        elif keyset and exclude is not None:
+            exclude = [field for field in exclude if field not in kwargs['keyset_fields']]
 
-        callback(result)
+        args = [query]
+        projection = self._projection(fields, exclude)
+        if projection is not None:
+            args.append(projection)
 
-    @gen.coroutine
-    def select_multiple(self, table, data, **kwargs):
-        cursor = getattr(self.db, table).find(data)
+        cursor = self.db[table].find(*args)
+
+        # the count policy is set by Model.find_all for paginated queries.
+        # anything other than an exact count fetches one extra row so the
+        # caller can tell if there is a next page
+        count = kwargs.get('count', COUNT_EXACT)
 
         # handle pagination
         if 'page' in kwargs:
             page = kwargs['page']
             page_size = kwargs.get('page_size', 10)
             offset = (page - 1) * page_size
-            cursor.limit(page_size)
+            cursor.limit(page_size if count == COUNT_EXACT else page_size + 1)
             cursor.skip(offset)
 
+        if keyset:
+            cursor.limit(kwargs['page_size'] + 1)
+
         # default sort to newest first
-        sort = kwargs.get('sort', [('_id', 0)])
+        sort = kwargs.get('sort', [('_id', -1)])
         cursor.sort(sort)
 
-        data = []
-        while (yield cursor.fetch_next):
-            data.append(cursor.next_object())
+        data = await cursor.to_list(None)
+
+        note(query, len(data))
+
+        total_count = None
+        if 'page' not in kwargs and not keyset:
+            total_count = len(data)
+        elif count == COUNT_ESTIMATE and len(spec) == 0:
+
+            # counting a whole collection comes from its metadata
+            total_count = await self.db[table].estimated_document_count()
+        elif count == COUNT_CACHED:
+            count_key = (self.connection.get_key(), json.dumps(spec, sort_keys=True, default=str))
+            total_count = count_cache.get(table, count_key)
+            if total_count is None:
+                total_count = await self.db[table].count_documents(spec)
+                count_cache.set(table, count_key, total_count)
+
+        # there is no cheap estimate for a filtered query so fall back to
+        # counting it
+        elif count in (COUNT_EXACT, COUNT_ESTIMATE):
+            total_count = await self.db[table].count_documents(spec)
+
+        return [data, total_count]
+
+    def _keyset_query(self, data, sort, after):
+        after = [ObjectId(value) if field == '_id' else value
+                 for (field, direction), value in zip(sort, after)]
+
+        # for a descending sort on a then b that is:
+        # a < x OR (a == x AND b < y)
+        #
+        # null (or a missing field) sorts before everything else and can't
+        # be compared with $lt or $gt so those are matched separately.  for a
+        # descending sort with x null nothing comes after it in a
+        bits = []
+        for i, (field, direction) in enumerate(sort):
+            bit = [{sort[j][0]: after[j]} for j in range(i)]
+
+            if after[i] is None:
+                if direction < 0:
+                    continue
+
+                bit.append({field: {'$ne': None}})
+            elif direction < 0:
+                bit.append({'$or': [{field: {'$lt': after[i]}}, {field: None}]})
+            else:
+                bit.append({field: {'$gt': after[i]}})
+
+            bits.append(bit[0] if len(bit) == 1 else {'$and': bit})
 
-        total_count = yield motor.Op(cursor.count)
+        keyset = {'$or': bits}
+        if len(data) == 0:
+            return keyset
 
-        callback = kwargs.get('callback')
+        return {'$and': [data, keyset]}
 
-        if callback is None:
-            raise gen.Return([data, total_count])
+    @coroutine
+    @instrumented('select_in')
+    async def select_in(self, table, field, values):
+        await self.connect()
 
-        callback([data, total_count])
+        if field == '_id':
+            values = [ObjectId(value) for value in values]
 
-    @gen.coroutine
-    def insert(self, table, data, callback=None):
-        result = yield self.update(table, data, callback)
+        cursor = self.db[table].find({field: {'$in': values}})
+        data = await cursor.to_list(None)
 
-        if callback is None:
-            raise gen.Return(result)
+        note({field: {'$in': values}}, len(data))
+        return data
 
-        callback(result)
+    @coroutine
+    async def select_iter(self, table, data, batch_size=500):
+        await self.connect()
 
-    @gen.coroutine
-    def update(self, table, data, changes, primary_key, callback=None):
-        self.connect()
+        cursor = self.db[table].find(data)
+        cursor.batch_size(batch_size)
+        stream = ResultStream(cursor, batch_size)
 
-        if primary_key in data:
-            data[primary_key] = ObjectId(data[primary_key])
+        return stream
 
-        result = yield motor.Op(self.db[table].save, data)
+    @coroutine
+    @instrumented('insert')
+    async def insert(self, table, data):
+        await self.connect()
 
-        if callback is None:
-            raise gen.Return(result)
+        result = await self.db[table].insert_one(data)
+        note(rows=1)
 
-        callback(result)
+        return result.inserted_id
 
-    @gen.coroutine
-    def delete(self, table, primary_key_fields, primary_key_values, callback=None):
-        self.connect()
+    @coroutine
+    @instrumented('insert_many')
+    async def insert_many(self, table, rows, primary_key=None):
+        await self.connect()
+
+        result = []
+        if len(rows) > 0:
+            result = (await self.db[table].insert_many(rows)).inserted_ids
+            note(rows=len(rows))
+
+        return result
+
+    @coroutine
+    @instrumented('update')
+    async def update(self, table, data, changes, primary_key):
+        if len(changes) == 0:
+            return False
+
+        await self.connect()
+
+        # only send the fields that changed.  a field that changed but is no
+        # longer in the data was deleted from the object
+        to_set = {}
+        to_unset = {}
+        for key in changes:
+            if key == primary_key:
+                continue
+
+            if key in data:
+                to_set[key] = data[key]
+                continue
+
+            to_unset[key] = ''
+
+        document = {}
+        if len(to_set) > 0:
+            document['$set'] = to_set
+
+        if len(to_unset) > 0:
+            document['$unset'] = to_unset
+
+        if len(document) == 0:
+            return False
+
+        spec = {primary_key: ObjectId(data[primary_key])}
+        result = await self.db[table].update_one(spec, document)
+        note(spec, result.matched_count)
+
+        return result
+
+    @coroutine
+    @instrumented('delete')
+    async def delete(self, table, primary_key_fields, primary_key_values):
+        await self.connect()
 
         to_delete = {
             primary_key_fields[0]: ObjectId(primary_key_values[0])
         }
 
-        result = yield motor.Op(self.db[table].remove, to_delete)
+        result = await self.db[table].delete_one(to_delete)
+        note(to_delete, result.deleted_count)
 
-        if callback is None:
-            raise gen.Return(result)
+        return result
 
-        callback(result)
+    @coroutine
+    @instrumented('delete_many')
+    async def delete_many(self, table, primary_key, values):
+        await self.connect()
+
+        if primary_key == '_id':
+            values = [ObjectId(value) for value in values]
+
+        spec = {primary_key: {'$in': values}}
+        result = await self.db[table].delete_many(spec)
+        note(spec, result.deleted_count)
+
+        return result.deleted_count
+
+
+class ResultStream(object):
+    def __init__(self, cursor, batch_size):
+        self.cursor = cursor
+        self.batch_size = batch_size
+
+    @coroutine
+    async def fetch_batch(self):
+        # the cursor only goes to the server when the documents from the
+        # last batch it got have all been used
+        return await self.cursor.to_list(self.batch_size)
+
+    @coroutine
+    async def close(self):
+        await self.cursor.close()
+
+        return True
 
 
 class ConnectionPool(ConnectionPool):
+    """Shares one MongoDb between everything that uses the pool
+
+    motor keeps up to count sockets open for the client.  After lifetime
+    seconds the next get_db connects a new client and the old one is closed
+    when that one is replaced in turn, so queries that are still running on
+    it get a whole lifetime to finish.
+
+    Call warm() at startup to open the sockets before the first request.
+    """
+    def __init__(self, connection, count=10, lifetime=3600):
+        super(ConnectionPool, self).__init__(connection, count, lifetime)
+        self._db = None
+        self._retired = None
+
     def get_db_class(self):
         return MongoDb
+
+    def _is_expired(self, db):
+        return time.time() - db.start_time > self.lifetime
+
+    @coroutine
+    async def get_db(self):
+        db = self._db
+        if db is None or self._is_expired(db):
+            db = MongoDb(self.connection, max_pool_size=self.count)
+            await db.connect()
+
+            # someone else might have replaced it while this one connected
+            if self._db is not None and not self._is_expired(self._db):
+                await db.close()
+                return self._db
+
+            if self._retired is not None:
+                await self._retired.close()
+
+            self._retired = self._db
+            self._db = db
+
+        return db
+
+    @coroutine
+    async def warm(self):
+        """connects and opens count sockets by running that many pings at
+        the same time"""
+        db = await self.get_db()
+        await asyncio.gather(*[db.ping() for i in range(self.count)])
+        return True
+
+    @coroutine
+    async def close(self):
+        for db in (self._db, self._retired):
+            if db is not None:
+                await db.close()
+
+        self._db = None
+        self._retired = None
+        return True
@@ -1,43 +1,108 @@
-import sys
+import re
+import json
 import datetime
-from tornado import gen
+import asyncio
+from storm.compat import coroutine
+from storm.instrument import instrumented, note
+from storm.cache import count_cache
+from storm.collection import COUNT_EXACT, COUNT_ESTIMATE, COUNT_CACHED
 from storm.db import Database, ConnectionPool
 from storm import error
 import tornado_mysql
 from tornado_mysql.pools import Pool
 
 cursor_type = tornado_mysql.cursors.DictCursor
+ss_cursor_type = tornado_mysql.cursors.SSDictCursor
+
+# types that the driver knows how to bind into a statement
+_sql_types = (str, bytes, int, float, datetime.date)
+
+# sql text for each statement shape that has been built.  the values are
+# bound by the driver so the same text is reused for every save of a model
+# with the same fields
+STATEMENT_CACHE_SIZE = 2000
+_statements = {}
+
+SELECT_IN_CHUNK_SIZE = 1000
+
+# queries that can return more than one column with the same name, which a
+# derived table does not allow, see Query.can_wrap
+_joins = re.compile(r'\bJOIN\b|\bFROM\s+((?!\b(WHERE|GROUP|HAVING|ORDER|LIMIT)\b)[^()])*,', re.IGNORECASE)
+
+# (database, table) => the names of its columns, see MySql._get_columns
+_table_columns = {}
+
+# (host, port, database) => (consecutive ids, auto_increment_increment), see
+# MySql._get_auto_increment
+_auto_increment = {}
+
+
+def _cache_statement(key, statement):
+    if len(_statements) >= STATEMENT_CACHE_SIZE:
+        _statements.clear()
+
+    _statements[key] = statement
+    return statement
+
+
+def _columns(fields):
+    if len(fields) == 0:
+        return ''
+
+    return "`%s`" % '`, `'.join(fields)
+
+
+def _placeholder(value):
+    # NOW() has to stay in the sql so it is evaluated by mysql
+    if value == 'NOW()':
+        return 'NOW()'
+
+    return '%s'
 
 
 class MySql(Database):
-    @gen.coroutine
-    def connect(self, callback=None):
+    """A MySQL database
+
+    Queries run on a pool of up to max_pool_size connections.  With adaptive
+    set the pool starts at min_pool_size and grows when queries have to wait
+    for a connection, see AdaptivePool.
+    """
+    def __init__(self, connection, min_pool_size=1, max_pool_size=10, adaptive=True):
+        super(MySql, self).__init__(connection)
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        self.adaptive = adaptive
+
+    @coroutine
+    async def connect(self):
         if not self.is_connected:
-            self.db = Pool(
+            self.db = AdaptivePool(
                 dict(user=self.connection.user,
                      passwd=self.connection.password,
                      db=self.connection.database,
                      cursorclass=cursor_type),
-                max_idle_connections=1,
-                max_open_connections=1)
+                min_size=self.min_pool_size,
+                max_size=self.max_pool_size,
+                adaptive=self.adaptive)
 
             self.is_connected = True
 
-        if callback is None:
-            raise gen.Return(True)
-
-        callback(True)
+        return True
 
-    @gen.coroutine
-    def close(self, callback=None):
+    @coroutine
+    async def close(self):
         if self.is_connected:
-            yield self.db.close()
+            await self.db.close()
             self.is_connected = False
 
-        if callback is None:
-            raise gen.Return(True)
+        return True
 
-        callback(True)
+    def stats(self):
+        """returns how the connection pool is being used"""
+        if not self.is_connected:
+            return None
+
+        return self.db.stats()
 
     @staticmethod
     def _quote(value):
@@ -50,8 +115,8 @@ class MySql(Database):
         if value == 'NOW()':
             return value
 
-        # convert python3 byte strings
-        if sys.version_info >= (3,0,0) and isinstance(value, bytes):
+        # convert byte strings
+        if isinstance(value, bytes):
             value = value.decode('utf-8')
 
         if isinstance(value, float):
@@ -64,149 +129,559 @@ class MySql(Database):
 
         return value
 
-    @gen.coroutine
-    def select_one(self, table, **kwargs):
-        yield self.connect()
-
-        where_bits = []
-        for key in kwargs:
-            where_bits.append("`%s` = %s" % (key, MySql._quote(kwargs[key])))
-
-        sql = "SELECT * FROM `%s` WHERE BINARY %s" % (table, ' AND BINARY '.join(where_bits))
-
-        cur = yield self.db.execute(sql)
+    @coroutine
+    async def _get_columns(self, table):
+        """returns the names of the columns in table.  they are looked up
+        once per table so a column added while running is only seen after
+        a restart"""
+        key = (self.connection.database, table)
+        columns = _table_columns.get(key)
+        if columns is None:
+            cur = await self.db.execute("SHOW COLUMNS FROM `%s`" % table)
+            columns = _table_columns[key] = [row['Field'] for row in cur.fetchall()]
+
+        return columns
+
+    @coroutine
+    async def _get_select_columns(self, table, fields, exclude):
+        """returns the columns of table to select or None for all of them.
+        only for statements that select from the table itself"""
+        if fields is None and exclude is not None:
+            fields = [column for column in (await self._get_columns(table)) if column not in exclude]
+
+        return fields
+
+    @coroutine
+    @instrumented('select_one')
+    async def select_one(self, table, fields=None, exclude=None, **kwargs):
+        await self.connect()
+
+        columns = await self._get_select_columns(table, fields, exclude)
+
+        fields = tuple(sorted(kwargs))
+        key = ('select_one', table, fields, tuple(columns) if columns is not None else None)
+        sql = _statements.get(key)
+        if sql is None:
+            where_bits = ["BINARY `%s` = %%s" % field for field in fields]
+            sql = _cache_statement(key, "SELECT %s FROM `%s` WHERE %s" % (_columns(columns) if columns is not None else '*',
+                                                                         table, ' AND '.join(where_bits)))
+
+        cur = await self.db.execute(sql, [kwargs[field] for field in fields])
         result = cur.fetchone()
+        note(sql, 0 if result is None else 1)
 
         if result is None:
             raise error.StormNotFoundError("Object of type: %s not found with args: %s" % (table, kwargs))
 
-        callback = kwargs.get('callback')
-        if callback is None:
-            raise gen.Return(result)
-
-        callback(result)
+        return result
 
 
-    @gen.coroutine
-    def select_multiple(self, table, query, **kwargs):
-        yield self.connect()
+    @coroutine
+    @instrumented('select_multiple')
+    async def select_multiple(self, table, query, **kwargs):
+        await self.connect()
 
         query.bind(':table', table)
 
+        # the count policy is set by Model.find_all for paginated queries.
+        # anything other than an exact count fetches one extra row so the
+        # caller can tell if there is a next page
+        count = kwargs.get('count', COUNT_EXACT)
+
         page = kwargs.get('page')
         if page:
             page_size = kwargs.get('page_size', 10)
-            query.limit = page_size
+            query.limit = page_size if count == COUNT_EXACT else page_size + 1
             query.offset = (page - 1) * page_size
 
+        # keyset pagination, see Model.find_all
+        keyset = 'keyset_fields' in kwargs
+        if keyset:
+            query.order = kwargs['sort']
+            query.after = kwargs['after']
+            query.limit = kwargs['page_size'] + 1
+
+        # only select some of the columns.  the filters that run in python
+        # and the keyset cursor need theirs in the rows as well
+        columns = kwargs.get('fields')
+        if columns is not None:
+            columns = list(columns)
+            for column in [f.key for f in query._split_filters()[2]] + kwargs.get('keyset_fields', []):
+                if column not in columns:
+                    columns.append(column)
+
+        query.fields = columns
+
         raw_sql = query.sql
 
-        total_count = 0
+        total_count = None
+        if not page and not keyset:
+            count = None
 
-        tasks = [self.db.execute(raw_sql)]
-        if page:
-            tasks.append(self.db.execute(query.count_sql))
+        count_key = None
+        if count == COUNT_CACHED:
+            count_key = (self.connection.get_key(), query.count_sql, tuple(query.count_params))
+            total_count = count_cache.get(table, count_key)
+
+        tasks = [(raw_sql, query.params)]
+        if count == COUNT_ESTIMATE:
+            tasks.append((query.estimate_sql, query.count_params))
+        elif count == COUNT_EXACT or (count == COUNT_CACHED and total_count is None):
+            tasks.append((query.count_sql, query.count_params))
 
-        cursors = yield tasks
+        cursors = await self._execute_all(tasks)
+
+        data = cursors[0].fetchall()
+        note(raw_sql, len(data))
+        if not page and not keyset:
+            total_count = len(data)
 
-        results = [cursors[0].fetchall()]
         if len(cursors) > 1:
-            results.append(cursors[1].fetchall())
+            if count == COUNT_ESTIMATE:
+                total_count = self._get_estimate(cursors[1].fetchall())
+            else:
+                total_count = cursors[1].fetchall()[0]['count']
 
-        data = results[0]
-        total_count = len(data)
-        if len(results) == 2:
-            total_count = results[1][0]['count']
+            if count == COUNT_CACHED:
+                count_cache.set(table, count_key, total_count)
 
         data, filtered_out_count = query.apply_filters(data)
-        total_count -= filtered_out_count
+        if total_count is not None:
+            total_count -= filtered_out_count
 
-        callback = kwargs.get('callback', None)
-        if callback is None:
-            raise gen.Return([data, total_count])
+        # the query can select anything, not just the columns of the table,
+        # so excluded columns are taken out of the rows instead of listing
+        # the others in the sql
+        exclude = [column for column in kwargs.get('exclude') or () if column not in kwargs.get('keyset_fields', ())]
+        if len(exclude) > 0:
+            for row in data:
+                for column in exclude:
+                    row.pop(column, None)
 
-        callback([data, total_count])
+        return [data, total_count]
 
 
-    @gen.coroutine
-    def insert(self, table, data, callback=None):
-        yield self.connect()
+    @coroutine
+    @instrumented('select_in')
+    async def select_in(self, table, field, values):
+        if len(values) == 0:
+            note(rows=0)
+            return []
 
-        fields = []
-        values = []
-        for key in data:
-            fields.append(key)
-            value = MySql._quote(data[key])
-            values.append(value)
+        await self.connect()
+
+        # keep the statements (and the number of cached ones) a sane size
+        chunks = [values[i:i + SELECT_IN_CHUNK_SIZE] for i in range(0, len(values), SELECT_IN_CHUNK_SIZE)]
+
+        tasks = []
+        for chunk in chunks:
+            key = ('select_in', table, field, len(chunk))
+            sql = _statements.get(key)
+            if sql is None:
+                sql = _cache_statement(key, "SELECT * FROM `%s` WHERE `%s` IN (%s)" %
+                                       (table, field, ', '.join(['%s'] * len(chunk))))
+
+            tasks.append((sql, chunk))
+
+        cursors = await self._execute_all(tasks)
 
-        sql = "INSERT INTO `%s` (`%s`) VALUES (%s)" % (table, '`, `'.join(fields), ', '.join(values))
+        data = []
+        for cur in cursors:
+            data.extend(cur.fetchall())
 
-        # double escape % sign so we don't get an error if one of the fields
-        # we are trying to insert has a % in it
-        sql = sql.replace('%', '%%')
+        note(sql, len(data))
+        return data
 
-        cur = yield self.db.execute(sql)
-        insert_id = cur.lastrowid
+    @coroutine
+    async def _execute_all(self, statements):
+        """runs a list of (sql, params) at the same time on connections from
+        the pool and returns their cursors in the same order"""
+        return await asyncio.gather(*[self.db.execute(sql, params) for sql, params in statements])
 
-        if callback is None:
-            raise gen.Return(insert_id)
+    @staticmethod
+    def _get_estimate(plan):
+        """works out the number of rows from the output of EXPLAIN"""
+        if len(plan) == 0 or plan[0].get('rows') is None:
+            return None
+
+        rows = plan[0]['rows']
+        if plan[0].get('filtered') is not None:
+            rows = rows * plan[0]['filtered'] / 100
+
+        return int(rows)
 
-        callback(insert_id)
+    @coroutine
+    async def select_iter(self, table, query, batch_size=500):
+        await self.connect()
 
-    @gen.coroutine
-    def update(self, table, data, changes, primary_key, callback=None):
+        query.bind(':table', table)
+        stream = ResultStream(self.db, query.sql, query.params, query, batch_size)
+
+        return stream
+
+    @coroutine
+    @instrumented('insert')
+    async def insert(self, table, data):
+        await self.connect()
+
+        insert_id = await self._insert(table, data)
+        note(rows=1)
+
+        return insert_id
+
+    async def _insert(self, table, data):
+        fields = tuple(data)
+        placeholders = tuple([_placeholder(data[field]) for field in fields])
+
+        key = ('insert', table, fields, placeholders)
+        sql = _statements.get(key)
+        if sql is None:
+            sql = _cache_statement(key, "INSERT INTO `%s` (%s) VALUES (%s)" %
+                                   (table, _columns(fields), ', '.join(placeholders)))
+
+        params = [data[field] for field, placeholder in zip(fields, placeholders) if placeholder == '%s']
+
+        cur = await self.db.execute(sql, params)
+        note(sql)
+
+        return cur.lastrowid
+
+    @coroutine
+    async def _get_auto_increment(self):
+        """returns a tuple of (whether the ids for the rows of one insert
+        statement are consecutive, auto_increment_increment)
+
+        with innodb_autoinc_lock_mode = 2, the default since MySQL 8, inserts
+        that run at the same time can take ids in between each other's"""
+        key = (self.connection.host, self.connection.port, self.connection.database)
+        settings = _auto_increment.get(key)
+        if settings is None:
+            cur = await self.db.execute("SELECT @@innodb_autoinc_lock_mode AS `lock_mode`, "
+                                        "@@auto_increment_increment AS `increment`")
+            row = cur.fetchone()
+            settings = _auto_increment[key] = (int(row['lock_mode']) != 2, int(row['increment']))
+
+        return settings
+
+    @coroutine
+    @instrumented('insert_many')
+    async def insert_many(self, table, rows, primary_key=None):
+        """inserts the rows with one statement per set of fields and returns
+        the generated id for each row
+
+        ids can only be worked out from a multiple row insert when mysql
+        hands them out one after the other.  otherwise the rows that don't
+        set primary_key are inserted one at a time"""
+        await self.connect()
+
+        # rows can only share an INSERT statement if they have the same
+        # fields so group them first and keep track of where they came from
+        groups = {}
+        for i, data in enumerate(rows):
+            fields = tuple(sorted(data))
+            placeholders = tuple([_placeholder(data[field]) for field in fields])
+            groups.setdefault((fields, placeholders), []).append(i)
+
+        insert_ids = [None] * len(rows)
+        for fields, placeholders in groups:
+            indexes = groups[(fields, placeholders)]
+
+            if len(indexes) > 1 and primary_key not in fields:
+                consecutive, increment = await self._get_auto_increment()
+                if not consecutive:
+                    for i in indexes:
+                        insert_ids[i] = await self._insert(table, rows[i])
+
+                    continue
+
+            key = ('insert_many', table, fields, placeholders, len(indexes))
+            sql = _statements.get(key)
+            if sql is None:
+                values = ', '.join(['(%s)' % ', '.join(placeholders)] * len(indexes))
+                sql = _cache_statement(key, "INSERT INTO `%s` (%s) VALUES %s" %
+                                       (table, _columns(fields), values))
+
+            params = []
+            for i in indexes:
+                data = rows[i]
+                params.extend([data[field] for field, placeholder in zip(fields, placeholders) if placeholder == '%s'])
+
+            cur = await self.db.execute(sql, params)
+            note(sql)
+
+            if primary_key in fields:
+                for i in indexes:
+                    insert_ids[i] = rows[i][primary_key]
+
+            # for a multiple row insert lastrowid is the id generated for the
+            # first row.  with innodb_autoinc_lock_mode 0 or 1 the rest follow
+            # it auto_increment_increment apart since the number of rows is
+            # known up front
+            elif cur.lastrowid:
+                increment = 1 if len(indexes) == 1 else (await self._get_auto_increment())[1]
+                for offset, i in enumerate(indexes):
+                    insert_ids[i] = cur.lastrowid + offset * increment
+
+        note(rows=len(rows))
+        return insert_ids
+
+    @coroutine
+    @instrumented('update')
+    async def update(self, table, data, changes, primary_key):
         if len(changes) == 0:
-            raise gen.Return(False)
+            return False
 
-        yield self.connect()
+        await self.connect()
 
         if 'modified_on' in data:
             changes.append('modified_on')
             data['modified_on'] = 'NOW()'
 
-        pairs = []
         compound_primary_key = isinstance(primary_key, list)
+        if not compound_primary_key:
+            primary_key = [primary_key]
+
+        fields = []
         for key in changes:
-            if compound_primary_key and key in primary_key:
+            if key in primary_key or key in fields:
                 continue
 
-            if key == primary_key:
-                continue
+            fields.append(key)
 
-            pairs.append("`%s` = %s" % (key, MySql._quote(data[key])))
+        # a field that changed but is not in the data was deleted from the
+        # object so it gets set to null
+        fields = tuple(fields)
+        values = [data.get(field) for field in fields]
+        placeholders = tuple([_placeholder(value) for value in values])
 
-        if not compound_primary_key:
-            primary_key = [primary_key]
+        key = ('update', table, fields, placeholders, tuple(primary_key))
+        sql = _statements.get(key)
+        if sql is None:
+            pairs = ["`%s` = %s" % pair for pair in zip(fields, placeholders)]
+            where_bits = ["`%s` = %%s" % field for field in primary_key]
+            sql = _cache_statement(key, "UPDATE `%s` SET %s WHERE %s" %
+                                   (table, ', '.join(pairs), ' AND '.join(where_bits)))
 
-        where_bits = []
-        for key in primary_key:
-            where_bits.append("`%s` = %s" % (key, MySql._quote(data[key])))
+        params = [value for value, placeholder in zip(values, placeholders) if placeholder == '%s']
+        params.extend([data[field] for field in primary_key])
 
-        sql = "UPDATE `%s` SET %s WHERE %s" % (table, ', '.join(pairs), ' AND '.join(where_bits))
+        result = await self.db.execute(sql, params)
+        note(sql, result.rowcount)
+        return result
 
-        result = yield self.db.execute(sql)
-        if callback is None:
-            raise gen.Return(result)
+    @coroutine
+    @instrumented('delete')
+    async def delete(self, table, primary_key_fields, primary_key_values):
+        await self.connect()
 
-        callback(result)
+        result = False
+        if len(primary_key_fields) > 0:
+            key = ('delete', table, tuple(primary_key_fields))
+            sql = _statements.get(key)
+            if sql is None:
+                where_bits = ["`%s` = %%s" % field for field in primary_key_fields]
+                sql = _cache_statement(key, "DELETE FROM `%s` WHERE %s" % (table, ' AND '.join(where_bits)))
 
-    @gen.coroutine
-    def delete(self, table, primary_key_fields, primary_key_values, callback=None):
-        self.connect()
+            result = await self.db.execute(sql, list(primary_key_values))
+            note(sql, result.rowcount)
 
-        where_bits = []
-        for i, key in enumerate(primary_key_fields):
-            where_bits.append("`%s` = %s" % (key, MySql._quote(primary_key_values[i])))
+        return result
 
-        result = False
-        if len(where_bits) > 0:
-            sql = "DELETE FROM `%s` WHERE %s" % (table, ' AND '.join(where_bits))
-            result = yield self.db.execute(sql)
+    @coroutine
+    @instrumented('delete_many')
+    async def delete_many(self, table, primary_key, values):
+        await self.connect()
+
+        result = 0
+        for start in range(0, len(values), SELECT_IN_CHUNK_SIZE):
+            chunk = values[start:start + SELECT_IN_CHUNK_SIZE]
+
+            key = ('delete_many', table, primary_key, len(chunk))
+            sql = _statements.get(key)
+            if sql is None:
+                sql = _cache_statement(key, "DELETE FROM `%s` WHERE `%s` IN (%s)" %
+                                       (table, primary_key, ', '.join(['%s'] * len(chunk))))
 
-        if callback is None:
-            raise gen.Return(result)
+            cur = await self.db.execute(sql, list(chunk))
+            result += cur.rowcount
+            note(sql, result)
+
+        return result
+
+    @coroutine
+    async def begin(self):
+        """returns a MySqlTransaction that runs every statement on one
+        connection from the pool until it is committed or rolled back"""
+        await self.connect()
+
+        transaction = MySqlTransaction(self.connection)
+        transaction.db = await self.db.begin()
+        transaction.is_connected = True
+
+        return transaction
+
+
+class MySqlTransaction(MySql):
+    """A MySql whose statements all run in the same transaction
+
+    Statements on a transaction have to run one after the other since they
+    share a connection.
+    """
+    @coroutine
+    async def connect(self):
+        if not self.is_connected:
+            raise error.StormError('transaction has already been committed or rolled back')
+
+        return True
+
+    @coroutine
+    async def begin(self):
+        raise error.StormError('transaction has already begun')
+
+    @coroutine
+    async def _execute_all(self, statements):
+        cursors = []
+        for sql, params in statements:
+            cursors.append(await self.db.execute(sql, params))
+
+        return cursors
+
+    @coroutine
+    async def select_iter(self, table, query, batch_size=500):
+        """the rows are read from the transaction's connection in one go and
+        handed out in batches since an unbuffered cursor would need a
+        connection of its own"""
+        await self.connect()
+
+        query.bind(':table', table)
+        cur = await self.db.execute(query.sql, query.params)
+
+        return BufferedResultStream(cur.fetchall(), query, batch_size)
+
+    @coroutine
+    async def commit(self):
+        await self.db.commit()
+        self.is_connected = False
+
+        return True
+
+    @coroutine
+    async def rollback(self):
+        await self.db.rollback()
+        self.is_connected = False
+
+        return True
+
+    @coroutine
+    async def close(self):
+        if self.is_connected:
+            await self.rollback()
+
+        return True
+
+
+class ResultStream(object):
+    """Reads the results of a query in batches using an unbuffered cursor
+
+    The cursor holds on to a connection from the pool until all of the rows
+    have been read or the stream is closed.
+    """
+    def __init__(self, pool, sql, params, query, batch_size):
+        self.pool = pool
+        self.sql = sql
+        self.params = params
+        self.query = query
+        self.batch_size = batch_size
+        self._conn = None
+        self._cursor = None
+        self._exhausted = False
+        self._done = False
+
+    @coroutine
+    async def _open(self):
+        # the pool only hands out buffered cursors so check out a connection
+        # of our own for the unbuffered one
+        self._conn = await self.pool._get_conn()
+        self._cursor = self._conn.cursor(ss_cursor_type)
+
+        try:
+            await self._cursor.execute(self.sql, self.params)
+        except:
+            self._discard()
+            raise
+
+    def _discard(self):
+        conn = self._conn
+        self._conn = self._cursor = None
+        self._done = True
+        if conn is not None:
+            self.pool._close_conn(conn)
+
+    @coroutine
+    async def fetch_batch(self):
+        rows = []
+        while not self._done and len(rows) == 0:
+            if self._cursor is None:
+                await self._open()
+
+            try:
+                rows = await self._cursor.fetchmany(self.batch_size)
+            except:
+                self._discard()
+                raise
+
+            if len(rows) < self.batch_size:
+                self._exhausted = True
+                await self.close()
+
+            rows = self.query.apply_filters(rows)[0]
+
+        return rows
+
+    @coroutine
+    async def close(self):
+        if self._conn is not None:
+
+            # an unbuffered result has to be read to the end before the
+            # connection can be used again so only give the connection back
+            # to the pool if we got that far
+            if self._exhausted:
+                conn = self._conn
+                await self._cursor.close()
+                self._conn = self._cursor = None
+                self.pool._put_conn(conn)
+            else:
+                self._discard()
+
+        self._done = True
+
+        return True
+
+
+class BufferedResultStream(object):
+    """A ResultStream for rows that have already been read"""
+    def __init__(self, rows, query, batch_size):
+        self.rows = rows
+        self.query = query
+        self.batch_size = batch_size
+        self._offset = 0
+
+    @coroutine
+    async def fetch_batch(self):
+        rows = []
+        while self._offset < len(self.rows) and len(rows) == 0:
+            rows = self.rows[self._offset:self._offset + self.batch_size]
+            self._offset += self.batch_size
+            rows = self.query.apply_filters(rows)[0]
+
+        return rows
+
+    @coroutine
+    async def close(self):
+        self.rows = []
+
+        return True
 
-        callback(result)
 
 class QueryFilter(object):
     TYPE_EQUAL = '='
@@ -243,15 +718,92 @@ class QueryFilter(object):
 
         return True
 
+    def _can_bind(self, value):
+        return value is None or isinstance(value, _sql_types)
+
+    def to_sql(self):
+        """returns a tuple of (sql condition, params) or None if the filter
+        can only be checked in python"""
+        key = "`%s`" % self.key.replace('`', '``')
+
+        if self.comparison in (self.TYPE_IN, self.TYPE_NOT_IN):
+            if not isinstance(self.value, (list, tuple, set, frozenset)):
+                return None
+
+            values = list(self.value)
+            for value in values:
+                if value is None or not self._can_bind(value):
+                    return None
+
+            # "IN ()" is not valid sql
+            if len(values) == 0:
+                return ('0' if self.comparison == self.TYPE_IN else '1', [])
+
+            placeholders = ', '.join(['%s'] * len(values))
+            binary = len([value for value in values if self._is_string(value)]) > 0
+            if self.comparison == self.TYPE_IN:
+                if binary:
+                    # the plain IN can still use an index, the BINARY one
+                    # makes it match case and trailing spaces like python
+                    return ("(%s IN (%s) AND BINARY %s IN (%s))" % (key, placeholders, key, placeholders),
+                            values + values)
+
+                return ("%s IN (%s)" % (key, placeholders), values)
+
+            # in python None is not in any list of values
+            return ("(%s IS NULL OR %s%s NOT IN (%s))" % (key, 'BINARY ' if binary else '', key, placeholders), values)
+
+        if not self._can_bind(self.value):
+            return None
+
+        # strings are compared with the collation of the column in mysql so
+        # 'Bob' would match 'bob' and 'bob '.  BINARY compares them the way
+        # python does
+        binary = self._is_string(self.value)
+
+        # use the null safe operator so comparing against None works the same
+        # way it does in python
+        if self.comparison == self.TYPE_EQUAL:
+            if binary:
+                return ("(%s <=> %%s AND BINARY %s <=> %%s)" % (key, key), [self.value, self.value])
+
+            return ("%s <=> %%s" % key, [self.value])
+
+        if self.comparison == self.TYPE_NOT_EQUAL:
+            return ("NOT (%s%s <=> %%s)" % ('BINARY ' if binary else '', key), [self.value])
+
+        if self.value is None:
+            return None
+
+        if self.comparison in (self.TYPE_GREATER_THAN,
+                               self.TYPE_GREATER_THAN_OR_EQUAL,
+                               self.TYPE_LESS_THAN,
+                               self.TYPE_LESS_THAN_OR_EQUAL):
+            return ("%s%s %s %%s" % ('BINARY ' if binary else '', key, self.comparison), [self.value])
+
+        return None
+
+    @staticmethod
+    def _is_string(value):
+        return isinstance(value, (str, bytes))
+
 class Query(object):
     def __init__(self, sql):
         self._sql = sql
         self.count_sql = None
+        self.estimate_sql = None
+        self.params = None
+        self.count_params = None
         self.to_bind = {}
         self.limit = None
         self.offset = None
+        self.order = None
+        self.after = None
         self.filters = []
 
+        # the columns to select, all of them when None
+        self.fields = None
+
     def bind(self, key, value):
         self.to_bind[key] = value
         return self
@@ -260,25 +812,61 @@ class Query(object):
         self.filters.append(QueryFilter(key, comparison, value))
         return self
 
-    def all_filters_allow(self, row):
-        for f in self.filters:
+    def get_key(self):
+        """returns a string that is the same for queries that select the
+        same rows"""
+        filters = [(f.key, f.comparison, f.value) for f in self.filters]
+        return json.dumps([self._sql, sorted(self.to_bind.items()), filters,
+                           self.order, self.after, self.limit, self.offset, self.fields], default=str)
+
+    def all_filters_allow(self, row, filters=None):
+        for f in self.filters if filters is None else filters:
             if not f.matches(row):
                 return False
 
         return True
 
+    def can_wrap(self):
+        """returns False for queries that can't be wrapped in a derived table
+        because they join tables, which can return more than one column with
+        the same name.  their filters all run in python and fields are
+        ignored"""
+        return _joins.search(self._sql) is None
+
+    def _split_filters(self):
+        conditions = []
+        params = []
+        python_filters = []
+        can_wrap = self.can_wrap()
+        for f in self.filters:
+            condition = f.to_sql() if can_wrap else None
+            if condition is None:
+                python_filters.append(f)
+                continue
+
+            conditions.append(condition[0])
+            params.extend(condition[1])
+
+        return (conditions, params, python_filters)
+
     def apply_filters(self, data):
-        if self.limit or self.offset:
-            raise error.StormError("""You cannot apply filters when using page
-                                   and page_size to limit the mysql data""")
+        python_filters = self._split_filters()[2]
+
+        if len(python_filters) == 0:
+            return (data, 0)
+
+        if self.limit or self.offset or self.after is not None:
+            raise error.StormError("""You cannot apply filters that can't be
+                                   converted to sql when using page and
+                                   page_size to limit the mysql data""")
 
-        if len(data) == 0 or len(self.filters) == 0:
+        if len(data) == 0:
             return (data, 0)
 
         new_data = []
         num_removed = 0
         for row in data:
-            if self.all_filters_allow(row):
+            if self.all_filters_allow(row, python_filters):
                 new_data.append(row)
                 continue
 
@@ -286,51 +874,283 @@ class Query(object):
 
         return (new_data, num_removed)
 
+    def _keyset_condition(self):
+        """returns the condition that selects the rows that come after the
+        values in self.after given the sort order
+
+        for ORDER BY a DESC, b DESC that is: a < x OR (a = x AND b < y)
+
+        mysql sorts NULL before everything else so when a value is NULL the
+        comparisons turn into IS NULL and IS NOT NULL.  for a DESC with x
+        NULL nothing comes after it in a and that part is left out
+        """
+        bits = []
+        for i, (field, direction) in enumerate(self.order):
+            equal = ["`%s` IS NULL" % key if value is None else "`%s` = %%s" % key
+                     for (key, _), value in zip(self.order[:i], self.after)]
+
+            if self.after[i] is None:
+                if direction < 0:
+                    continue
+
+                after = "`%s` IS NOT NULL" % field
+            elif direction < 0:
+                after = "(`%s` < %%s OR `%s` IS NULL)" % (field, field)
+            else:
+                after = "`%s` > %%s" % field
+
+            bits.append(' AND '.join(equal + [after]))
+
+        return "(%s)" % ' OR '.join(["(%s)" % bit for bit in bits])
+
+    def _keyset_params(self):
+        params = []
+        for i, (field, direction) in enumerate(self.order):
+            if self.after[i] is None and direction < 0:
+                continue
+
+            params.extend([value for value in self.after[:i + 1] if value is not None])
+
+        return params
+
+    def _compile(self, table, binds, conditions):
+        """returns a tuple of (sql, count sql, estimate sql, bind order) for
+        the query"""
+        bind_order = []
+        pieces = [self._sql]
+        if len(binds) > 0 or table is not None:
+            keys = sorted(binds + ((':table',) if table is not None else ()), key=len, reverse=True)
+            pieces = re.split('(%s)' % '|'.join([re.escape(key) for key in keys]), self._sql)
+
+        # the statement is formatted by the driver so any % in the query
+        # itself has to be escaped
+        sql = ''
+        for i, piece in enumerate(pieces):
+            if i % 2 == 0:
+                sql += piece.replace('%', '%%')
+                continue
+
+            if piece == ':table':
+                sql += "`%s`" % table
+                continue
+
+            sql += '%s'
+            bind_order.append(piece)
+
+        # filters are applied to the columns of the result so wrap the query
+        # in a derived table.  mysql merges a simple query into the outer one
+        # which means the conditions can still use the indexes on the table
+        # and only the selected columns are sent back.  queries with GROUP
+        # BY, DISTINCT, aggregates or a LIMIT of their own are run into a
+        # temporary table first instead
+        can_wrap = self.can_wrap()
+        if self.order and not can_wrap:
+            raise error.StormError('keyset pagination does not work with queries that join tables')
+
+        if can_wrap and (len(conditions) > 0 or self.order or self.fields is not None):
+            sql = "SELECT %s FROM (%s) AS `storm_filtered`" % (_columns(self.fields) if self.fields is not None else '*', sql)
+            if len(conditions) > 0:
+                sql += " WHERE %s" % ' AND '.join(conditions)
+
+        # the count is for all of the matching rows, not just the ones after
+        # the keyset cursor.  the estimate explains the rows themselves since
+        # the plan for count(*) often has no rows at all ("Select tables
+        # optimized away")
+        count_sql = estimate_sql = None
+        if self.limit:
+            count_sql = "SELECT count(*) count FROM %s" % sql.split(' FROM ', 1)[1]
+            estimate_sql = "EXPLAIN %s" % sql
+
+        if self.after is not None:
+            sql += " AND " if len(conditions) > 0 else " WHERE "
+            sql += self._keyset_condition()
+
+        if self.order:
+            sql += " ORDER BY %s" % ', '.join(["`%s` %s" % (field, 'DESC' if direction < 0 else 'ASC')
+                                               for field, direction in self.order])
+
+        if self.limit:
+            sql += " LIMIT %s"
+
+        if self.offset:
+            sql += " OFFSET %s"
+
+        return (sql, count_sql, estimate_sql, bind_order)
+
     @property
     def sql(self):
-        sql = self._sql
-        if ':table' in self.to_bind:
-            sql = sql.replace(':table', "`%s`" % self.to_bind[':table'])
-            del(self.to_bind[':table'])
+        table = self.to_bind.get(':table')
+        binds = tuple(sorted([key for key in self.to_bind if key != ':table']))
+        conditions, filter_params = self._split_filters()[0:2]
 
-        for key in self.to_bind:
-            sql = sql.replace(key, MySql._quote(self.to_bind[key]))
+        order = tuple([tuple(item) for item in self.order]) if self.order else None
+        fields = tuple(self.fields) if self.fields is not None else None
+        key = ('query', self._sql, table, binds, tuple(conditions), order,
+               tuple([value is None for value in self.after]) if self.after is not None else None,
+               bool(self.limit), bool(self.offset), fields)
+        statement = _statements.get(key)
+        if statement is None:
+            statement = _cache_statement(key, self._compile(table, binds, conditions))
 
-        if self.limit:
-            self.count_sql = "SELECT count(*) count FROM %s" % sql.split(' FROM ')[1]
+        sql, self.count_sql, self.estimate_sql, bind_order = statement
+
+        params = [self.to_bind[bind] for bind in bind_order]
+        params.extend(filter_params)
+        self.count_params = list(params)
+
+        if self.after is not None:
+            params.extend(self._keyset_params())
 
         if self.limit:
-            sql += " LIMIT %d" % self.limit
+            params.append(self.limit)
 
         if self.offset:
-            sql += " OFFSET %d" % self.offset
+            params.append(self.offset)
 
+        self.params = params
         return sql
 
+class AdaptivePool(Pool):
+    """A tornado_mysql Pool that sizes itself to the load
+
+    The pool keeps min_size connections.  When a query has to queue behind
+    another one that is already waiting for a connection the pool opens
+    another one, up to max_size.  Connections that have been idle for
+    idle_timeout seconds are closed again, down to min_size, the next time
+    the pool is used.  Without adaptive the pool opens up to max_size
+    connections right away.
+
+    stats() returns how the pool is being used.
+    """
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, adaptive=True,
+                 idle_timeout=60, max_recycle_sec=3600):
+        min_size = max(1, min(min_size, max_size))
+        super(AdaptivePool, self).__init__(
+            connect_kwargs,
+            max_idle_connections=max_size,
+            max_recycle_sec=max_recycle_sec,
+            max_open_connections=min_size if adaptive else max_size)
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.adaptive = adaptive
+        self.idle_timeout = idle_timeout
+
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _shrink(self):
+        now = self.io_loop.time()
+
+        # the most recently used connections are at the front so the ones at
+        # the back are the ones that have been idle the longest
+        closing = 0
+        while (len(self._free_conn) > 0 and
+               self._opened_conns - closing > self.min_size and
+               now - self._free_conn[-1]._storm_idle_since > self.idle_timeout):
+            self._close_async(self._free_conn.pop())
+            closing += 1
+
+        self.max_open = max(self.min_size, min(self.max_open, self._opened_conns - closing))
+
+    def _record_wait(self, start):
+        def done(future):
+            wait = self.io_loop.time() - start
+            self.waits += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        return done
+
+    def _get_conn(self):
+        if self.adaptive:
+            self._shrink()
+
+            if (len(self._free_conn) == 0 and len(self._waitings) > 0 and
+                    self._opened_conns >= self.max_open and self.max_open < self.max_size):
+                self.max_open += 1
+
+        waiting = len(self._waitings)
+        future = super(AdaptivePool, self)._get_conn()
+        if len(self._waitings) > waiting:
+            future.add_done_callback(self._record_wait(self.io_loop.time()))
+
+        return future
+
+    def _put_conn(self, conn):
+        if self.io_loop.time() - conn.connected_time >= self.max_recycle_sec:
+            self._close_async(conn)
+            return
+
+        if self._waitings:
+            self._waitings.popleft().set_result(conn)
+            return
+
+        if self.max_idle == 0:
+            self._close_async(conn)
+            return
+
+        # reuse the connection that was used last first so the others stay
+        # idle long enough to be closed
+        conn._storm_idle_since = self.io_loop.time()
+        self._free_conn.appendleft(conn)
+
+    @coroutine
+    async def close(self):
+        """closes the idle connections and the ones in use as they are
+        given back"""
+        self.max_idle = 0
+        self.min_size = 0
+        while len(self._free_conn) > 0:
+            self._close_conn(self._free_conn.pop())
+
+        return True
+
+    def stats(self):
+        idle = len(self._free_conn)
+        return {
+            'size': self._opened_conns,
+            'limit': self.max_open,
+            'in_use': self._opened_conns - idle,
+            'idle': idle,
+            'waiters': len(self._waitings),
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'max_wait': self.max_wait
+        }
+
 
 class ConnectionPool(ConnectionPool):
-    def __init__(self, connection, count=10, lifetime=3600):
+    """Shares one MySql between everything that uses the pool
+
+    The pool keeps count connections and grows to max_count (count + 10 by
+    default) when queries start waiting for one.
+    """
+    def __init__(self, connection, count=10, lifetime=3600, max_count=None, adaptive=True):
         super(ConnectionPool, self).__init__(connection, count, lifetime)
-        db = MySql(self.connection)
-        db.db = Pool(
+        self.max_count = max_count if max_count is not None else count + 10
+
+        db = MySql(self.connection, count, self.max_count, adaptive)
+        db.db = AdaptivePool(
             dict(user=connection.user,
                  passwd=connection.password,
                  db=connection.database,
                  cursorclass=cursor_type),
-            max_idle_connections=self.count,
-            max_recycle_sec=self.lifetime,
-            max_open_connections=self.count+10)
+            min_size=self.count,
+            max_size=self.max_count,
+            adaptive=adaptive,
+            max_recycle_sec=self.lifetime)
 
         db.is_connected = True
         self._db = db
 
+    def stats(self):
+        return self._db.stats()
+
     def get_db_class(self):
         return MySql
 
-    @gen.coroutine
-    def get_db(self, callback=None):
-        if callback is not None:
-            callback(self._db)
-            return
-
-        raise gen.Return(self._db)
+    @coroutine
+    async def get_db(self):
+        return self._db
@@ -0,0 +1,67 @@
+from storm.error import StormError
+
+
+class Relation(object):
+    """Base class for relations declared in Model._relations
+
+    The model can be a class or the name of one so models can refer to each
+    other before they are defined.
+    """
+    many = False
+
+    def __init__(self, model, foreign_key):
+        self.model = model
+        self.foreign_key = foreign_key
+
+    def get_model(self):
+        if not isinstance(self.model, str):
+            return self.model
+
+        from storm.model import Model
+
+        classes = list(Model.__subclasses__())
+        while classes:
+            class_name = classes.pop()
+            if class_name.__name__ == self.model:
+                self.model = class_name
+                return class_name
+
+            classes.extend(class_name.__subclasses__())
+
+        raise StormError('relation refers to unknown model: %s' % self.model)
+
+    def get_keys(self, owner):
+        """returns a tuple of (the field on the owner, the field on the
+        related model) that have to match"""
+        raise NotImplementedError('The "get_keys" method is not implemented')
+
+
+class BelongsTo(Relation):
+    """The owner has a foreign key with the primary key of one object
+
+    class Post(Model):
+        _relations = {'author': BelongsTo('User', 'user_id')}
+    """
+    def get_keys(self, owner):
+        return (self.foreign_key, _get_primary_key(self.get_model()))
+
+
+class HasMany(Relation):
+    """Objects of the related model have a foreign key with the primary key
+    of the owner
+
+    class User(Model):
+        _relations = {'posts': HasMany('Post', 'user_id')}
+    """
+    many = True
+
+    def get_keys(self, owner):
+        return (_get_primary_key(owner), self.foreign_key)
+
+
+def _get_primary_key(class_name):
+    primary_key = getattr(class_name, '_primary_key', '_id')
+    if isinstance(primary_key, list):
+        raise StormError('relations do not support compound primary keys')
+
+    return primary_key
@@ -0,0 +1,139 @@
+import itertools
+from storm import context
+from storm.compat import coroutine
+from storm.db import ConnectionPool
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+
+class ReplicaPool(ConnectionPool):
+    """Sends writes to a primary and spreads reads over its replicas
+
+    primary = ConnectionPool(Connection(host='db1', ...))
+    replicas = [ConnectionPool(Connection(host='db2', ...)),
+                ConnectionPool(Connection(host='db3', ...))]
+    Model.set_db(ReplicaPool(primary, replicas))
+
+    The primary and replicas can be databases or connection pools.  Reads
+    go to the replicas in turn with ROUND_ROBIN or to the one with the fewest
+    reads running with LEAST_OUTSTANDING.
+
+    Once something writes inside of a request scope (see storm.context) the
+    rest of the reads in that scope go to the primary so they see the write.
+    Without a scope every read goes to a replica.
+    """
+    def __init__(self, primary, replicas, strategy=ROUND_ROBIN):
+        super(ReplicaPool, self).__init__(primary.connection)
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.outstanding = [0] * len(self.replicas)
+        self._next = itertools.cycle(range(len(self.replicas)))
+        self._db = RoutedDatabase(self)
+
+    def get_db_class(self):
+        if isinstance(self.primary, ConnectionPool):
+            return self.primary.get_db_class()
+
+        return type(self.primary)
+
+    @coroutine
+    async def get_db(self):
+        return self._db
+
+    def _choose_replica(self):
+        if self.strategy == LEAST_OUTSTANDING:
+            return self.outstanding.index(min(self.outstanding))
+
+        return next(self._next)
+
+    @staticmethod
+    async def _resolve(source):
+        if isinstance(source, ConnectionPool):
+            return await source.get_db()
+
+        return source
+
+    def _reads_primary(self):
+        scope = context.current_scope()
+        return len(self.replicas) == 0 or (scope is not None and scope.read_primary)
+
+    async def _read(self, method, *args, **kwargs):
+        if self._reads_primary():
+            db = await ReplicaPool._resolve(self.primary)
+            return await getattr(db, method)(*args, **kwargs)
+
+        index = self._choose_replica()
+        self.outstanding[index] += 1
+        try:
+            db = await ReplicaPool._resolve(self.replicas[index])
+            return await getattr(db, method)(*args, **kwargs)
+        finally:
+            self.outstanding[index] -= 1
+
+    async def _write(self, method, *args, **kwargs):
+        scope = context.current_scope()
+        if scope is not None:
+            scope.read_primary = True
+
+        db = await ReplicaPool._resolve(self.primary)
+        return await getattr(db, method)(*args, **kwargs)
+
+
+class RoutedDatabase(object):
+    """What ReplicaPool.get_db returns, it has the same methods as a
+    database and passes each one to the primary or a replica"""
+    def __init__(self, pool):
+        self.pool = pool
+
+        # the replicas have the same data so the primary's connection
+        # identifies all of them
+        self.connection = pool.connection
+
+    def get_read_key(self):
+        """where reads in the current scope go.  the same RoutedDatabase is
+        shared by every request so queries are only coalesced between
+        callers that read from the same place"""
+        return 'primary' if self.pool._reads_primary() else 'replica'
+
+    @coroutine
+    async def select_one(self, table, **kwargs):
+        return await self.pool._read('select_one', table, **kwargs)
+
+    @coroutine
+    async def select_multiple(self, table, data, **kwargs):
+        return await self.pool._read('select_multiple', table, data, **kwargs)
+
+    @coroutine
+    async def select_in(self, table, field, values):
+        return await self.pool._read('select_in', table, field, values)
+
+    @coroutine
+    async def select_iter(self, table, data, batch_size=500):
+        return await self.pool._read('select_iter', table, data, batch_size)
+
+    @coroutine
+    async def insert(self, table, data):
+        return await self.pool._write('insert', table, data)
+
+    @coroutine
+    async def insert_many(self, table, rows, primary_key=None):
+        return await self.pool._write('insert_many', table, rows, primary_key)
+
+    @coroutine
+    async def update(self, table, data, changes, primary_key):
+        return await self.pool._write('update', table, data, changes, primary_key)
+
+    @coroutine
+    async def delete(self, table, primary_key_fields, primary_key_values):
+        return await self.pool._write('delete', table, primary_key_fields, primary_key_values)
+
+    @coroutine
+    async def delete_many(self, table, primary_key, values):
+        return await self.pool._write('delete_many', table, primary_key, values)
+
+    @coroutine
+    async def begin(self):
+        # everything in a transaction runs on the primary
+        return await self.pool._write('begin')
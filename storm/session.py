@@ -0,0 +1,122 @@
+import asyncio
+from storm.compat import coroutine, maybe_await
+from storm.db import ConnectionPool
+from storm.model import Model
+
+
+class Session(object):
+    """Keeps track of the objects changed while handling a request and writes
+    all of them at once
+
+    session = Session()
+    session.add(user)
+    session.add(Post())
+    session.delete(comment)
+    yield session.flush()
+
+    flush runs every insert, update and delete in one transaction on a single
+    connection.  New objects are inserted with one statement per table and
+    objects with simple primary keys are deleted with one statement per
+    table.  Updates still run one at a time since each object can change
+    different fields.  If anything fails the transaction is rolled back and
+    the objects keep their changes so flush can be called again.
+
+    MongoDB has no transactions so there the writes happen as they run.
+    """
+    def __init__(self, db=None, chunk_size=500):
+        self.db = db
+        self.chunk_size = chunk_size
+        self._objects = []
+        self._deleted = []
+
+    @staticmethod
+    def _index(objects, obj):
+        for i, other in enumerate(objects):
+            if other is obj:
+                return i
+
+        return -1
+
+    def add(self, obj):
+        i = Session._index(self._deleted, obj)
+        if i != -1:
+            del(self._deleted[i])
+
+        if Session._index(self._objects, obj) == -1:
+            self._objects.append(obj)
+
+    def add_all(self, objects):
+        for obj in objects:
+            self.add(obj)
+
+    def delete(self, obj):
+        i = Session._index(self._objects, obj)
+        if i != -1:
+            del(self._objects[i])
+
+        # objects that were never saved have nothing to delete
+        if obj._needs_insert()[0]:
+            return
+
+        if Session._index(self._deleted, obj) == -1:
+            self._deleted.append(obj)
+
+    @property
+    def new(self):
+        return [obj for obj in self._objects if obj._needs_insert()[0]]
+
+    @property
+    def dirty(self):
+        return [obj for obj in self._objects
+                if not obj._needs_insert()[0] and len(obj._changes) > 0]
+
+    @property
+    def deleted(self):
+        return list(self._deleted)
+
+    @coroutine
+    async def _get_db(self):
+        db = self.db
+        if db is None:
+            db = await Model.get_db()
+        elif isinstance(db, ConnectionPool):
+            db = await db.get_db()
+
+        return db
+
+    @coroutine
+    async def flush(self):
+        """writes the new, dirty and deleted objects and returns the save
+        result for each of the new and dirty ones"""
+        new = self.new
+        to_save = new + self.dirty
+        deleted = self.deleted
+
+        results = []
+        if len(to_save) > 0 or len(deleted) > 0:
+            await asyncio.gather(*[maybe_await(obj.before_save(obj._changes)) for obj in to_save])
+
+            # remember which objects get a generated primary key so they can
+            # go back to being new if the transaction is rolled back
+            generated = [obj for obj in new if obj._needs_insert()[1]]
+
+            db = await self._get_db()
+            transaction = await db.begin()
+            try:
+                results = await Model._write_many(transaction, to_save, self.chunk_size)
+                await Model._delete_many(transaction, deleted)
+                await transaction.commit()
+            except Exception:
+                await transaction.rollback()
+
+                for obj in generated:
+                    if hasattr(obj, obj._primary_key):
+                        delattr(obj, obj._primary_key)
+
+                raise
+
+            await Model._after_save_many(to_save)
+            await Model._after_delete_many(deleted)
+            self._deleted = []
+
+        return results
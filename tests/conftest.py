@@ -0,0 +1,21 @@
+import pytest
+from storm import mysql
+from storm.cache import count_cache
+from storm.model import Model
+from tests.fakes import fake_mysql
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    mysql._auto_increment.clear()
+    count_cache.clear()
+    yield
+    Model.db = None
+
+
+@pytest.fixture
+def db():
+    """a MySql on a FakePool with one user that every Model uses"""
+    db = fake_mysql([{'id': 1, 'name': 'craig', 'settings': '{"theme":"dark"}'}])
+    Model.set_db(db)
+    return db
@@ -0,0 +1,336 @@
+"""Stand-ins for tornado_mysql's Pool that record the statements storm sends
+so the tests can check them without a database"""
+import re
+import asyncio
+from bson.objectid import ObjectId
+from pymongo.results import InsertOneResult, InsertManyResult, UpdateResult, DeleteResult
+from storm.db import Connection
+from storm.mongodb import MongoDb
+from storm.mysql import MySql
+
+
+class FakeCursor(object):
+    def __init__(self, rows, lastrowid=None, rowcount=None):
+        self.rows = rows
+        self.lastrowid = lastrowid
+        self.rowcount = len(rows) if rowcount is None else rowcount
+
+    def fetchone(self):
+        return self.rows[0] if len(self.rows) > 0 else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakePool(object):
+    """Answers queries from rows and keeps (sql, params) for each of them in
+    statements
+
+    Selects get every row, or the page of them for a LIMIT, without checking
+    any conditions.  The rows come from tables[table] when it is set, and an
+    IN query only gets the rows with the values it asks for.  Inserts get ids handed out the way mysql would with the
+    given innodb_autoinc_lock_mode and auto_increment_increment.  A statement that
+    contains fail_on raises.  Each query waits for delay seconds so tests can
+    run things at the same time.
+    """
+    def __init__(self, rows=None, lock_mode=1, increment=1):
+        self.rows = rows or []
+        self.tables = {}
+        self.lock_mode = lock_mode
+        self.increment = increment
+        self.statements = []
+        self.next_id = 1
+        self.fail_on = None
+        self.delay = 0
+        self.running = 0
+        self.max_running = 0
+
+    @property
+    def sql(self):
+        return [sql for sql, params in self.statements]
+
+    async def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+        # the result is what the rows were when the statement was sent, like
+        # a query that started before a write that finished while it ran
+        cursor = self._answer(sql, params)
+
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+
+        if self.fail_on is not None and self.fail_on in sql:
+            raise RuntimeError('failed: %s' % sql)
+
+        return cursor
+
+    def _answer(self, sql, params):
+        if sql.startswith('SELECT @@'):
+            return FakeCursor([{'lock_mode': self.lock_mode, 'increment': self.increment}])
+
+        if sql.startswith('INSERT'):
+            lastrowid = self.next_id
+            self.next_id += (sql.count('), (') + 1) * self.increment
+            return FakeCursor([], lastrowid, 1)
+
+        if sql.startswith('UPDATE') or sql.startswith('DELETE'):
+            return FakeCursor([], rowcount=1)
+
+        if sql.startswith('SHOW COLUMNS'):
+            return FakeCursor([{'Field': column} for column in self.rows[0]])
+
+        if sql.startswith('EXPLAIN'):
+            return FakeCursor([{'rows': len(self.rows), 'filtered': 100.0}])
+
+        if sql.startswith('SELECT count(*) count '):
+            return FakeCursor([{'count': len(self.rows)}])
+
+        rows = self.rows
+        table = re.search(r'FROM `(\w+)`', sql)
+        if table is not None and table.group(1) in self.tables:
+            rows = self.tables[table.group(1)]
+
+        field = re.match(r'SELECT \* FROM `\w+` WHERE `(\w+)` IN \(', sql)
+        if field is not None:
+            rows = [row for row in rows if row.get(field.group(1)) in params]
+
+        if sql.endswith(' LIMIT %s OFFSET %s'):
+            rows = rows[params[-1]:params[-1] + params[-2]]
+        elif sql.endswith(' LIMIT %s'):
+            rows = rows[:params[-1]]
+
+        return FakeCursor([dict(row) for row in rows])
+
+    async def begin(self):
+        self.statements.append(('BEGIN', None))
+        return FakeTransaction(self)
+
+
+class FakeTransaction(object):
+    """What FakePool.begin returns, it runs everything on one connection"""
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def execute(self, sql, params=None):
+        return await self.pool.execute(sql, params)
+
+    async def commit(self):
+        self.pool.statements.append(('COMMIT', None))
+
+    async def rollback(self):
+        self.pool.statements.append(('ROLLBACK', None))
+
+
+class FakeStreamCursor(object):
+    """The unbuffered cursor a ResultStream reads from"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = None
+        self.closed = False
+
+    async def execute(self, sql, params=None):
+        self.conn.pool.statements.append((sql, params))
+        if self.conn.pool.fail_on is not None and self.conn.pool.fail_on in sql:
+            raise RuntimeError('failed: %s' % sql)
+
+        self.rows = [dict(row) for row in self.conn.pool.rows]
+
+    async def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.cursors = []
+
+    def cursor(self, cursor_type=None):
+        self.cursors.append(FakeStreamCursor(self))
+        return self.cursors[-1]
+
+
+class FakeStreamPool(FakePool):
+    """A FakePool that also hands out connections for unbuffered cursors and
+    keeps the ones that were given back in put and closed in closed"""
+    def __init__(self, rows=None, **kwargs):
+        super(FakeStreamPool, self).__init__(rows, **kwargs)
+        self.conns = []
+        self.put = []
+        self.closed = []
+
+    async def _get_conn(self):
+        self.conns.append(FakeConnection(self))
+        return self.conns[-1]
+
+    def _put_conn(self, conn):
+        self.put.append(conn)
+
+    def _close_conn(self, conn):
+        self.closed.append(conn)
+
+
+def fake_mysql(rows=None, database='test', **kwargs):
+    db = MySql(Connection(database=database))
+    db.db = FakePool(rows, **kwargs)
+    db.is_connected = True
+    return db
+
+
+def _matches(document, spec):
+    for key, value in spec.items():
+        if key.startswith('$'):
+            continue
+
+        if isinstance(value, dict) and '$in' in value:
+            if document.get(key) not in value['$in']:
+                return False
+        elif document.get(key) != value:
+            return False
+
+    return True
+
+
+class FakeMongoCursor(object):
+    def __init__(self, documents):
+        self.documents = documents
+        self.sorted_by = None
+        self.limited_to = None
+        self.skipped = 0
+        self.read = 0
+        self.closed = False
+
+    def limit(self, limit):
+        self.limited_to = limit
+        return self
+
+    def skip(self, skip):
+        self.skipped = skip
+        return self
+
+    def sort(self, sort):
+        self.sorted_by = sort
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    async def to_list(self, length):
+        start = self.skipped + self.read
+        end = len(self.documents) if self.limited_to is None else self.skipped + self.limited_to
+        if length is not None:
+            end = min(end, start + length)
+
+        documents = self.documents[start:end]
+        self.read += len(documents)
+        return [dict(document) for document in documents]
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeMongoCollection(object):
+    """Keeps the documents of a collection in a list and records each call
+    as (collection, method, args...) in the calls of its FakeMongoDb.
+    Filters only match on equal values and $in, anything else matches every
+    document."""
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.documents = []
+        self.cursors = []
+
+    def _call(self, method, *args):
+        self.db.calls.append((self.name, method) + args)
+
+    async def find_one(self, spec, projection=None):
+        self._call('find_one', spec)
+        for document in self.documents:
+            if _matches(document, spec):
+                return dict(document)
+
+        return None
+
+    def find(self, spec, projection=None):
+        self._call('find', spec)
+        self.cursors.append(FakeMongoCursor([document for document in self.documents if _matches(document, spec)]))
+        return self.cursors[-1]
+
+    async def count_documents(self, spec):
+        self._call('count_documents', spec)
+        return len([document for document in self.documents if _matches(document, spec)])
+
+    async def estimated_document_count(self):
+        self._call('estimated_document_count')
+        return len(self.documents)
+
+    async def insert_one(self, document):
+        self._call('insert_one', document)
+        document.setdefault('_id', ObjectId())
+        self.documents.append(document)
+        return InsertOneResult(document['_id'], True)
+
+    async def insert_many(self, documents):
+        self._call('insert_many', documents)
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+            self.documents.append(document)
+
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+    async def update_one(self, spec, document):
+        self._call('update_one', spec, document)
+        for existing in self.documents:
+            if _matches(existing, spec):
+                existing.update(document.get('$set', {}))
+                for key in document.get('$unset', {}):
+                    existing.pop(key, None)
+
+                return UpdateResult({'n': 1, 'nModified': 1}, True)
+
+        return UpdateResult({'n': 0, 'nModified': 0}, True)
+
+    async def delete_one(self, spec):
+        self._call('delete_one', spec)
+        return self._delete(spec, 1)
+
+    async def delete_many(self, spec):
+        self._call('delete_many', spec)
+        return self._delete(spec, None)
+
+    def _delete(self, spec, limit):
+        deleted = [document for document in self.documents if _matches(document, spec)][:limit]
+        self.documents = [document for document in self.documents if document not in deleted]
+        return DeleteResult({'n': len(deleted)}, True)
+
+
+class FakeMongoDb(object):
+    """Stands in for a motor database"""
+    def __init__(self):
+        self.collections = {}
+        self.calls = []
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeMongoCollection(self, name)
+
+        return self.collections[name]
+
+    async def command(self, name):
+        self.calls.append((None, 'command', name))
+        return {'ok': 1.0}
+
+
+def fake_mongo(documents=None, table='users'):
+    db = MongoDb(Connection(database='test'))
+    db.db = FakeMongoDb()
+    db.db[table].documents = documents or []
+    db.is_connected = True
+    return db
@@ -0,0 +1,44 @@
+import asyncio
+from storm.model import Model
+from storm.mysql import Query
+
+
+class User(Model):
+    _table = 'users'
+
+
+def test_after_load_runs_for_every_object_up_to_the_limit(db):
+    db.db.rows = [{'id': i} for i in range(7)]
+    running = []
+    peak = []
+
+    class Limited(User):
+        _after_load_concurrency = 3
+
+        async def after_load(self):
+            running.append(self)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(self)
+            self.loaded = True
+
+    found = asyncio.run(Limited.find_all(Query('SELECT * FROM :table')))
+
+    assert [user.id for user in found] == list(range(7))
+    assert all(user.loaded for user in found)
+    assert max(peak) == 3
+
+
+def test_after_load_many_gets_the_whole_page(db):
+    db.db.rows = [{'id': i} for i in range(3)]
+    batches = []
+
+    class Batched(User):
+        @classmethod
+        async def after_load_many(class_name, objects):
+            batches.append([obj.id for obj in objects])
+
+    asyncio.run(Batched.find_all(Query('SELECT * FROM :table')))
+
+    assert batches == [[0, 1, 2]]
+
@@ -0,0 +1,101 @@
+import asyncio
+from storm import context
+from storm.cache import Cache, LruCache, ClientCache, MemoryClient
+from storm.collection import COUNT_CACHED
+from storm.model import Model
+from storm.mysql import Query
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+    _cache = None
+
+
+def test_lru_cache_evicts_the_oldest_row():
+    cache = LruCache(size=2)
+
+    async def run():
+        for i in range(3):
+            await cache.set_row('users', {'id': i}, str(i), {'id': i})
+
+        return [await cache.get_row('users', {'id': i}) for i in range(3)]
+
+    assert asyncio.run(run()) == [None, {'id': 1}, {'id': 2}]
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'evictions': 1, 'size': 2}
+
+
+def test_invalidate_removes_every_lookup_for_the_row():
+    cache = ClientCache(MemoryClient())
+
+    async def run():
+        await cache.set_row('users', {'email': 'a@b.c'}, '1', {'id': 1})
+        await cache.set_row('users', {'id': 1}, '1', {'id': 1})
+        await cache.invalidate('users', '1', {'id': 1})
+        return await cache.get_row('users', {'email': 'a@b.c'}), await cache.get_row('users', {'id': 1})
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_keys_include_the_database():
+    assert Cache.make_key('users', {'id': 1}) == 'storm:users:[["id",1]]'
+    assert Cache.make_key('users', {'id': 1}, 'localhost:None/test') == 'storm:localhost:None/test:users:[["id",1]]'
+
+
+def test_find_reads_through_the_cache(db):
+    User._cache = LruCache()
+
+    async def run():
+        await User.find(id=1)
+        return await User.find(id=1)
+
+    assert asyncio.run(run()).name == 'craig'
+    assert len(db.db.statements) == 1
+
+
+def test_saving_invalidates_the_cache(db):
+    User._cache = LruCache()
+
+    async def run():
+        user = await User.find(id=1)
+        user.name = 'new'
+        await user.save()
+        await User.find(id=1)
+
+    asyncio.run(run())
+
+    assert db.db.sql == ['SELECT * FROM `users` WHERE BINARY `id` = %s',
+                         'UPDATE `users` SET `name` = %s WHERE `id` = %s',
+                         'SELECT * FROM `users` WHERE BINARY `id` = %s']
+
+
+def test_cache_is_kept_per_database(db):
+    User._cache = LruCache()
+    other = fake_mysql([{'id': 1, 'name': 'other'}], database='other')
+
+    async def run():
+        first = await User.find(id=1)
+        with context.bind(other):
+            second = await User.find(id=1)
+
+        return first, second, await User.find(id=1)
+
+    first, second, third = asyncio.run(run())
+
+    assert (first.name, second.name, third.name) == ('craig', 'other', 'craig')
+    assert len(db.db.statements) == 1
+    assert User._cache.stats()['hits'] == 1
+
+
+def test_cached_counts_are_kept_per_database():
+    first = fake_mysql([{'id': 1}], database='first')
+    second = fake_mysql([{'id': 1}, {'id': 2}], database='second')
+
+    def count(db):
+        query = Query('SELECT * FROM :table')
+        return asyncio.run(db.select_multiple('users', query, page=1, page_size=10, count=COUNT_CACHED))[1]
+
+    assert count(first) == 1
+    assert count(second) == 2
+    assert count(first) == 1
+    assert len(first.db.statements) == 3
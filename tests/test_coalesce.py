@@ -0,0 +1,119 @@
+import asyncio
+from storm import context
+from storm.error import StormNotFoundError
+from storm.model import Model
+from storm.session import Session
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+
+
+def test_concurrent_finds_share_a_query(db):
+    db.db.delay = 0.01
+
+    async def run():
+        return await asyncio.gather(User.find(id=1), User.find(id=1))
+
+    first, second = asyncio.run(run())
+
+    assert len(db.db.statements) == 1
+    assert first.name == second.name == 'craig'
+    assert first is not second
+
+
+def test_concurrent_finds_share_not_found(db):
+    db.db.rows = []
+    db.db.delay = 0.01
+
+    async def run():
+        return await asyncio.gather(User.find(id=1), User.find(id=1), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(db.db.statements) == 1
+    assert all(isinstance(result, StormNotFoundError) for result in results)
+
+
+def test_cancelling_the_first_find_does_not_cancel_the_others(db):
+    db.db.delay = 0.01
+
+    async def run():
+        first = asyncio.ensure_future(User.find(id=1))
+        second = asyncio.ensure_future(User.find(id=1))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()).name == 'craig'
+    assert len(db.db.statements) == 1
+
+
+def test_finds_on_other_databases_are_not_shared(db):
+    other = fake_mysql([{'id': 1, 'name': 'other'}], database='other')
+    db.db.delay = other.db.delay = 0.01
+
+    async def find_on_other():
+        with context.bind(other):
+            return await User.find(id=1)
+
+    async def run():
+        return await asyncio.gather(User.find(id=1), find_on_other())
+
+    first, second = asyncio.run(run())
+
+    assert (first.name, second.name) == ('craig', 'other')
+
+
+def test_finds_after_a_write_do_not_wait_for_a_query_from_before_it(db):
+    db.db.delay = 0.05
+
+    async def run():
+        user = await User.find(id=1)
+
+        # another request is reading the row when this one writes to it
+        other = asyncio.ensure_future(User.find(id=1))
+        while len(db.db.statements) < 2:
+            await asyncio.sleep(0)
+
+        # the write is done before that read
+        db.db.delay = 0
+
+        user.name = 'new'
+        db.db.rows = [{'id': 1, 'name': 'new'}]
+        await user.save()
+
+        found = await User.find(id=1)
+        return (await other).name, found.name
+
+    assert asyncio.run(run()) == ('craig', 'new')
+    assert db.db.sql == ['SELECT * FROM `users` WHERE BINARY `id` = %s',
+                         'SELECT * FROM `users` WHERE BINARY `id` = %s',
+                         'UPDATE `users` SET `name` = %s WHERE `id` = %s',
+                         'SELECT * FROM `users` WHERE BINARY `id` = %s']
+
+
+def test_finds_after_a_flush_do_not_wait_for_a_query_from_before_it(db):
+    db.db.delay = 0.05
+
+    async def run():
+        user = await User.find(id=1)
+        other = asyncio.ensure_future(User.find(id=1))
+        while len(db.db.statements) < 2:
+            await asyncio.sleep(0)
+
+        # the write is done before that read
+        db.db.delay = 0
+
+        user.name = 'new'
+        db.db.rows = [{'id': 1, 'name': 'new'}]
+        session = Session()
+        session.add(user)
+        await session.flush()
+
+        found = await User.find(id=1)
+        await other
+        return found.name
+
+    assert asyncio.run(run()) == 'new'
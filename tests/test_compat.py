@@ -0,0 +1,100 @@
+import asyncio
+from storm.compat import maybe_await
+from storm.model import Model
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+class User(Model):
+    _table = 'users'
+
+
+def test_find_can_be_awaited(db):
+    async def run():
+        return await User.find(id=1)
+
+    assert asyncio.run(run()).name == 'craig'
+
+
+def test_find_takes_a_callback(db):
+    found = []
+
+    async def run():
+        await User.find(id=1, callback=found.append)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert [user.name for user in found] == ['craig']
+
+
+def test_maybe_await():
+    async def value():
+        return 1
+
+    async def run():
+        return await maybe_await(value()), await maybe_await(2)
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_hooks_can_be_plain_functions(db):
+    calls = []
+
+    class Hooked(Model):
+        _table = 'users'
+
+        def before_save(self, changes):
+            calls.append('before_save')
+
+        def after_save(self, changes):
+            calls.append('after_save')
+
+        def after_load(self):
+            calls.append('after_load')
+
+    user = asyncio.run(Hooked.find(id=1))
+    user.name = 'new'
+    asyncio.run(user.save())
+
+    assert calls == ['after_load', 'before_save', 'after_save']
+
+
+def test_find_can_be_yielded_from_a_gen_coroutine(db):
+    @gen.coroutine
+    def find():
+        user = yield User.find(id=1)
+        return user
+
+    async def run():
+        return await find()
+
+    assert asyncio.run(run()).name == 'craig'
+
+
+def test_ensure_future_for_add_future(db):
+    found = []
+
+    async def run():
+        future = asyncio.ensure_future(User.find(id=1))
+        IOLoop.current().add_future(future, lambda future: found.append(future.result()))
+        await future
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert [user.name for user in found] == ['craig']
+
+
+def test_spawn_callback_saves_without_waiting(db):
+    user = User()
+    user.name = 'new'
+
+    async def run():
+        IOLoop.current().spawn_callback(user.save)
+        while not hasattr(user, 'id'):
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert db.db.sql == ['INSERT INTO `users` (`name`) VALUES (%s)']
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from storm import context
+from storm.error import StormError
+from storm.model import Model
+from tests.fakes import fake_mysql
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.web import Application, RequestHandler
+
+
+class User(Model):
+    _table = 'users'
+
+
+def test_check_for_handler_raises(db, monkeypatch):
+    monkeypatch.setattr(Model, 'check_for_handler', True)
+
+    with pytest.raises(StormError, match='RequestScopeMixin'):
+        asyncio.run(User.find(id=1))
+
+
+def test_concurrent_scopes_do_not_leak(db):
+    other = fake_mysql([{'id': 1, 'name': 'other'}])
+
+    async def find(bound):
+        with context.bind(bound, identity_map=True) as scope:
+            await asyncio.sleep(0.01)
+            user = await User.find(id=1)
+            await asyncio.sleep(0.01)
+            return await Model.get_db(), user, scope.identity_map
+
+    async def run():
+        return await asyncio.gather(find(db), find(other), User.find(id=1))
+
+    (db_a, user_a, map_a), (db_b, user_b, map_b), user = asyncio.run(run())
+
+    assert db_a is db and db_b is other
+    assert user_a.name == 'craig' and user_b.name == 'other'
+    assert map_a.get(User, '1') is user_a and map_b.get(User, '1') is user_b
+    assert user is not user_a and context.current_scope() is None
+
+
+class Handler(context.RequestScopeMixin, RequestHandler):
+    use_identity_map = True
+
+    def initialize(self, dbs):
+        self.dbs = dbs
+
+    def prepare(self):
+        self.db = self.dbs[self.get_argument('db')]
+        return super(Handler, self).prepare()
+
+    async def get(self):
+        await asyncio.sleep(0.01)
+        user = await User.find(id=1)
+        await asyncio.sleep(0.01)
+
+        same_db = await Model.get_db() is self.db
+        same_user = await User.find(id=1) is user
+        self.write({'name': user.name, 'same_db': same_db, 'same_user': same_user,
+                    'objects': len(context.identity_map())})
+
+
+def test_mixin_requests_do_not_leak(db):
+    dbs = {'a': db, 'b': fake_mysql([{'id': 1, 'name': 'other'}])}
+
+    async def run():
+        sock, port = bind_unused_port()
+        server = HTTPServer(Application([('/', Handler, {'dbs': dbs})]))
+        server.add_sockets([sock])
+        try:
+            client = AsyncHTTPClient()
+            return await asyncio.gather(*[client.fetch('http://127.0.0.1:%s/?db=%s' % (port, name))
+                                          for name in ('a', 'b', 'a')])
+        finally:
+            server.stop()
+
+    bodies = [response.body for response in asyncio.run(run())]
+
+    assert bodies == [b'{"name": "craig", "same_db": true, "same_user": true, "objects": 1}',
+                      b'{"name": "other", "same_db": true, "same_user": true, "objects": 1}',
+                      b'{"name": "craig", "same_db": true, "same_user": true, "objects": 1}']
+    assert context.current_scope() is None
+
+
+def test_saving_replaces_the_object_in_the_identity_map(db):
+    async def run():
+        with context.bind(identity_map=True):
+            found = await User.find(id=1)
+
+            other = User()
+            other.id = 1
+            other.name = 'new'
+            other._changes = ['name']
+            await other.save()
+
+            return found, other, await User.find(id=1)
+
+    found, other, found_again = asyncio.run(run())
+
+    assert found_again is other and found_again is not found
+    assert len([sql for sql in db.db.sql if sql.startswith('SELECT')]) == 1
+
+
+def test_save_many_replaces_the_objects_in_the_identity_map(db):
+    async def run():
+        with context.bind(identity_map=True) as scope:
+            await User.find(id=1)
+
+            other = User()
+            other.id = 1
+            other.name = 'new'
+            other._changes = ['name']
+            await User.save_many([other])
+
+            return other, scope.identity_map.get(User, '1')
+
+    other, mapped = asyncio.run(run())
+
+    assert mapped is other
@@ -0,0 +1,74 @@
+import asyncio
+from bson.objectid import ObjectId
+from storm.model import Model, _converters
+from tests.fakes import fake_mongo, fake_mysql
+
+ROW = {'id': 1, 'name': 'craig', 'settings': '{"theme": "dark"}'}
+
+
+class User(Model):
+    _table = 'users'
+    _json_fields = ['settings']
+
+
+def test_matches_building_the_object_by_hand(db):
+    converted = User._convert_object(dict(ROW))
+
+    built = User()
+    for key, value in ROW.items():
+        setattr(built, key, value)
+    built._reset_changes()
+
+    assert converted.name == built.name and converted.settings == {'theme': 'dark'}
+    assert converted._changes == [] and converted._table == built._table == 'users'
+    assert converted._primary_key == 'id' and converted._type == 'user'
+
+
+def test_custom_init_and_setattr_run():
+    class Custom(User):
+        def __init__(self):
+            super(Custom, self).__init__()
+            self.extra = 'set in init'
+
+        def __setattr__(self, name, value):
+            if name == 'name':
+                value = value.upper()
+
+            super(Custom, self).__setattr__(name, value)
+
+    Model.set_db(fake_mysql())
+    obj = Custom._convert_object(dict(ROW))
+
+    assert obj.extra == 'set in init' and obj.name == 'CRAIG'
+    assert obj._changes == []
+
+
+def test_custom_convert_object_is_used(db):
+    class Converted(User):
+        @classmethod
+        def _convert_object(class_name, obj):
+            obj['converted'] = True
+            return super(Converted, class_name)._convert_object(obj)
+
+    assert Converted._get_converter() == Converted._convert_object
+    assert asyncio.run(Converted.find(id=1)).converted
+
+
+def test_converters_are_built_once_per_database(db):
+    first = User._get_converter()
+    assert User._get_converter() is first
+
+    Model.set_db(fake_mysql())
+    assert len(_converters) == 0
+    assert User._get_converter() is not first
+
+
+def test_mongo_primary_keys_are_strings():
+    class Document(Model):
+        _table = 'users'
+        _primary_key = '_id'
+
+    Model.set_db(fake_mongo())
+    object_id = ObjectId()
+
+    assert Document._convert_object({'_id': object_id})._id == str(object_id)
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from storm.collection import COUNT_ESTIMATE, get_count_policy
+from storm.error import StormError
+from storm.model import Model
+from storm.mysql import Query
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+
+
+def users(count):
+    return [{'id': i} for i in range(count)]
+
+
+def find_page(count):
+    return asyncio.run(User.find_all(Query('SELECT * FROM :table'), page=1, page_size=10, count=count))
+
+
+def test_count_policies():
+    assert get_count_policy(True) == 'exact'
+    assert get_count_policy(False) == 'none'
+
+    with pytest.raises(StormError):
+        get_count_policy('sometimes')
+
+
+def test_exact(db):
+    db.db.rows = users(25)
+    page = find_page('exact')
+
+    assert db.db.sql == ['SELECT * FROM `users` LIMIT %s', 'SELECT count(*) count FROM `users`']
+    assert db.db.statements[0][1] == [10]
+    assert page.total_count == 25
+    assert len(page) == 10
+
+
+def test_none_fetches_one_more_row(db):
+    db.db.rows = users(11)
+    page = find_page('none')
+
+    assert db.db.statements == [('SELECT * FROM `users` LIMIT %s', [11])]
+    assert page.total_count is None
+    assert page.has_next()
+    assert len(page) == 10
+
+
+def test_estimate_explains_the_rows(db):
+    db.db.rows = users(25)
+    page = find_page('estimate')
+
+    assert db.db.sql[1] == 'EXPLAIN SELECT * FROM `users`'
+    assert page.total_count == 25
+
+
+def test_estimate_leaves_out_the_limit():
+    query = Query('SELECT * FROM :table').bind(':table', 'users')
+    query.filter('age', '>', 3)
+    query.limit = 10
+    query.sql
+
+    assert query.estimate_sql == 'EXPLAIN SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE `age` > %s'
+
+
+def test_estimate_uses_the_filtered_rows():
+    db = fake_mysql()
+    assert db._get_estimate([{'rows': 200, 'filtered': 10.0}]) == 20
+    assert db._get_estimate([{'rows': None}]) is None
+    assert db._get_estimate([]) is None
+
+
+def test_cached_until_a_save(db):
+    db.db.rows = users(25)
+    assert find_page('cached').total_count == 25
+    assert find_page('cached').total_count == 25
+    assert db.db.sql.count('SELECT count(*) count FROM `users`') == 1
+
+    user = User()
+    user.name = 'new'
+    asyncio.run(user.save())
+
+    find_page('cached')
+    assert db.db.sql.count('SELECT count(*) count FROM `users`') == 2
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from storm.model import Model, DeclaredModel
+from tests.fakes import fake_mysql
+
+
+class User(DeclaredModel):
+    _table = 'users'
+    _fields = ('id', 'name', 'settings')
+    _json_fields = ('settings',)
+
+
+class Admin(User):
+    _fields = ('level',)
+
+
+class Thing(DeclaredModel):
+    _fields = ('id',)
+
+
+def test_tables():
+    assert Admin._table == 'users'
+    assert Thing._table == 'thing'
+    assert not hasattr(DeclaredModel, '_table')
+
+
+def test_fields_are_inherited():
+    admin = Admin()
+    admin.name = 'craig'
+    admin.level = 1
+
+    assert admin._get_data() == {'name': 'craig', 'level': 1}
+    assert admin._changes == {'name', 'level'}
+
+
+def test_undeclared_fields_can_not_be_set():
+    with pytest.raises(AttributeError):
+        User().email = 'craig@example.com'
+
+
+def test_primary_key_follows_the_database(monkeypatch):
+    monkeypatch.delattr(Model, '_primary_key', raising=False)
+    user = User()
+    assert user._primary_key == '_id'
+
+    Model.set_db(fake_mysql())
+    assert user._primary_key == 'id'
+    assert Thing._primary_key == 'id'
+
+
+def test_find_and_save(db):
+    user = asyncio.run(User.find(id=1))
+
+    assert user.name == 'craig'
+    assert user.settings == {'theme': 'dark'}
+    assert user._changes == set()
+
+    user.name = 'new'
+    asyncio.run(user.save())
+
+    assert db.db.statements[-1] == ('UPDATE `users` SET `name` = %s WHERE `id` = %s', ['new', 1])
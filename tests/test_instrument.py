@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import pytest
+from storm import instrument
+from storm.model import Model
+from storm.mysql import Query
+
+
+class User(Model):
+    _table = 'users'
+
+
+@pytest.fixture
+def events():
+    events = []
+    instrument.add_hook(after=events.append)
+    yield events
+    instrument.clear_hooks()
+
+
+def test_events(db, events):
+    asyncio.run(User.find_all(Query('SELECT * FROM :table')))
+
+    assert len(events) == 1
+    event = events[0]
+    assert (event.db, event.table, event.operation) == (db, 'users', 'select_multiple')
+    assert event.statement == 'SELECT * FROM `users`'
+    assert event.rows == 1 and event.error is None and event.elapsed >= 0
+
+
+def test_errors_are_recorded(db, events):
+    db.db.fail_on = 'SELECT'
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(db.select_one('users', id=1))
+
+    assert isinstance(events[0].error, RuntimeError)
+
+
+@pytest.mark.parametrize('hooked', [False, True])
+def test_select_in_without_values(db, request, hooked):
+    if hooked:
+        events = request.getfixturevalue('events')
+
+    assert asyncio.run(db.select_in('users', 'id', [])) == []
+    assert db.db.statements == []
+
+    if hooked:
+        assert events[0].rows == 0 and events[0].error is None
+
+
+def test_failing_hooks_are_logged(db, caplog):
+    def fail(event):
+        raise ValueError()
+
+    instrument.add_hook(before=fail)
+    try:
+        asyncio.run(db.select_one('users', id=1))
+    finally:
+        instrument.clear_hooks()
+
+    assert 'instrumentation hook failed' in caplog.text
+
+
+def test_filter_shape():
+    spec = {'name': 'craig', '$or': [{'age': {'$gt': 3}}, {'tags': ['a']}]}
+
+    assert instrument.filter_shape(spec) == {'name': '?', '$or': [{'age': {'$gt': '?'}}, {'tags': '?'}]}
+
+
+def test_slow_query_log(db, caplog):
+    instrument.add_hook(after=instrument.SlowQueryLog(0))
+    try:
+        with caplog.at_level(logging.WARNING, logger='storm.slow'):
+            asyncio.run(db.select_one('users', id=1))
+    finally:
+        instrument.clear_hooks()
+
+    assert 'slow select_one on users' in caplog.text
+
+
+def test_latency_histograms(db):
+    histograms = instrument.LatencyHistograms(buckets=(1,))
+    instrument.add_hook(after=histograms)
+    try:
+        asyncio.run(db.select_one('users', id=1))
+        asyncio.run(db.select_one('users', id=1))
+    finally:
+        instrument.clear_hooks()
+
+    exported = histograms.export()['users']['select_one']
+    assert exported['count'] == 2 and exported['errors'] == 0
+    assert exported['buckets'] == {'1': 2, '+inf': 0}
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from storm.model import Model
+from storm.mysql import Query
+from tests.fakes import fake_mysql, FakeStreamPool
+
+
+class User(Model):
+    _table = 'users'
+
+
+@pytest.fixture
+def pool():
+    db = fake_mysql()
+    db.db = FakeStreamPool([{'id': i} for i in range(5)])
+    Model.set_db(db)
+    return db.db
+
+
+def test_reading_everything_gives_the_connection_back(pool):
+    async def run():
+        return [user.id async for user in User.iter_all(Query('SELECT * FROM :table'), batch_size=2)]
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+    assert pool.put == pool.conns and pool.closed == []
+    assert pool.conns[0].cursors[0].closed
+
+
+def test_leaving_async_with_early_closes_the_connection(pool):
+    async def run():
+        async with User.iter_all(Query('SELECT * FROM :table'), batch_size=2) as users:
+            async for user in users:
+                break
+
+        return users
+
+    users = asyncio.run(run())
+
+    # the rest of the rows were never read so the connection can't be reused
+    assert pool.closed == pool.conns and pool.put == []
+    assert asyncio.run(users.next_batch()) == []
+
+
+def test_aclose(pool):
+    async def run():
+        users = User.iter_all(Query('SELECT * FROM :table'), batch_size=2)
+        await users.next_batch()
+        await users.aclose()
+
+    asyncio.run(run())
+
+    assert pool.closed == pool.conns
+
+
+def test_failed_query_closes_the_connection(pool):
+    pool.fail_on = 'SELECT'
+
+    async def run():
+        async with User.iter_all(Query('SELECT * FROM :table')) as users:
+            await users.next_batch()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+    assert pool.closed == pool.conns and pool.put == []
@@ -0,0 +1,74 @@
+import asyncio
+import json
+from storm import codec
+from storm.model import Model
+
+
+class User(Model):
+    _table = 'users'
+    _json_fields = ['settings']
+
+
+def test_json_is_decoded_when_it_is_read(db):
+    user = asyncio.run(User.find(id=1))
+
+    assert user._raw_json == {'settings': '{"theme":"dark"}'}
+    assert user.settings == {'theme': 'dark'}
+    assert 'settings' in user.__dict__
+
+
+def test_json_that_is_not_read_is_left_out_of_the_data(db):
+    user = asyncio.run(User.find(id=1))
+
+    assert 'settings' not in user._get_data()
+    assert user._as_dict()['settings'] == {'theme': 'dark'}
+
+
+def test_json_that_is_not_changed_is_saved_as_it_was_loaded(db):
+    user = asyncio.run(User.find(id=1))
+    user.name = 'new'
+
+    assert user._get_save_data()['settings'] == '{"theme":"dark"}'
+
+    asyncio.run(user.save())
+    assert db.db.statements[-1] == ('UPDATE `users` SET `name` = %s WHERE `id` = %s', ['new', 1])
+
+
+def test_json_that_changed_is_encoded(db):
+    user = asyncio.run(User.find(id=1))
+    user.settings = {'theme': 'light'}
+    asyncio.run(user.save())
+
+    assert db.db.statements[-1] == ('UPDATE `users` SET `settings` = %s WHERE `id` = %s', ['{"theme": "light"}', 1])
+
+
+def test_json_is_encoded_on_insert(db):
+    user = User()
+    user.settings = {'theme': 'light'}
+    asyncio.run(user.save())
+
+    assert db.db.statements[-1] == ('INSERT INTO `users` (`settings`) VALUES (%s)', ['{"theme": "light"}'])
+    assert user.id == 1
+
+
+def test_invalid_json_decodes_to_an_empty_dict(db):
+    db.db.rows = [{'id': 1, 'settings': 'not json'}]
+
+    assert asyncio.run(User.find(id=1)).settings == {}
+
+
+def test_set_json():
+    class Codec(object):
+        loads = staticmethod(json.loads)
+
+        @staticmethod
+        def dumps(value):
+            return json.dumps(value).encode('utf-8')
+
+    codec.set_json(Codec)
+    try:
+        assert codec.dumps({'a': 1}) == '{"a": 1}'
+    finally:
+        codec.set_json()
+
+    assert codec.dumps({'a': 1}) == '{"a": 1}'
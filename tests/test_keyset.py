@@ -0,0 +1,105 @@
+import asyncio
+from bson.objectid import ObjectId
+from storm.collection import encode_cursor, decode_cursor
+from storm.db import Connection
+from storm.model import Model
+from storm.mongodb import MongoDb
+from storm.mysql import Query
+
+OBJECT_ID = '5f0000000000000000000000'
+
+
+class User(Model):
+    _table = 'users'
+
+
+def keyset_query(order, after):
+    query = Query('SELECT * FROM :table').bind(':table', 'users')
+    query.order = order
+    query.after = after
+    query.limit = 11
+    return query
+
+
+def test_cursor():
+    assert decode_cursor(encode_cursor([None, 'a', 3])) == [None, 'a', 3]
+
+
+def test_keyset():
+    query = keyset_query([('created', -1), ('id', -1)], [100, 7])
+    query.filter('age', '>', 3)
+
+    assert query.sql == ('SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE `age` > %s AND '
+                         '(((`created` < %s OR `created` IS NULL)) OR (`created` = %s AND (`id` < %s OR `id` IS NULL))) '
+                         'ORDER BY `created` DESC, `id` DESC LIMIT %s')
+    assert query.params == [3, 100, 100, 7, 11]
+
+    # the count is for every page
+    assert query.count_params == [3]
+
+
+def test_keyset_after_null():
+    query = keyset_query([('created', 1), ('id', 1)], [None, 7])
+
+    assert query.sql == ('SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE '
+                         '((`created` IS NOT NULL) OR (`created` IS NULL AND `id` > %s)) '
+                         'ORDER BY `created` ASC, `id` ASC LIMIT %s')
+    assert query.params == [7, 11]
+
+    # the statement for a cursor without nulls is cached separately
+    query.after = [5, 7]
+    assert '`created` > %s' in query.sql
+    assert query.params == [5, 5, 7, 11]
+
+
+def test_keyset_after_null_descending():
+    query = keyset_query([('created', -1), ('id', -1)], [None, 7])
+
+    # nulls sort last descending so only other nulls can come after one
+    assert query.sql == ('SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE '
+                         '((`created` IS NULL AND (`id` < %s OR `id` IS NULL))) '
+                         'ORDER BY `created` DESC, `id` DESC LIMIT %s')
+    assert query.params == [7, 11]
+
+
+def test_find_all_pages_by_cursor(db):
+    db.db.rows = [{'id': 3, 'created': None}, {'id': 2, 'created': None}, {'id': 1, 'created': 5}]
+
+    users = asyncio.run(User.find_all(Query('SELECT * FROM :table'), after=None, page_size=1, sort=[('created', 1)]))
+
+    assert users.has_next()
+    assert users.total_count is None
+    assert db.db.sql == ['SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` ORDER BY `created` ASC, `id` ASC LIMIT %s']
+    assert decode_cursor(users.next_cursor) == [None, 3]
+
+    asyncio.run(User.find_all(Query('SELECT * FROM :table'), after=users.next_cursor, page_size=1, sort=[('created', 1)]))
+
+    sql, params = db.db.statements[-1]
+    assert '(`created` IS NOT NULL) OR (`created` IS NULL AND `id` > %s)' in sql
+    assert params == [3, 2]
+
+
+def mongo_keyset_query(data, sort, after):
+    return MongoDb(Connection())._keyset_query(data, sort, after)
+
+
+def test_mongo_keyset():
+    assert mongo_keyset_query({'type': 'basic'}, [('created', 1), ('_id', 1)], [5, OBJECT_ID]) == {'$and': [
+        {'type': 'basic'},
+        {'$or': [{'created': {'$gt': 5}},
+                 {'$and': [{'created': 5}, {'_id': {'$gt': ObjectId(OBJECT_ID)}}]}]}
+    ]}
+
+
+def test_mongo_keyset_after_null():
+    assert mongo_keyset_query({}, [('created', 1), ('_id', 1)], [None, OBJECT_ID]) == {
+        '$or': [{'created': {'$ne': None}},
+                {'$and': [{'created': None}, {'_id': {'$gt': ObjectId(OBJECT_ID)}}]}]
+    }
+
+
+def test_mongo_keyset_after_null_descending():
+    assert mongo_keyset_query({}, [('created', -1), ('_id', -1)], [None, OBJECT_ID]) == {
+        '$or': [{'$and': [{'created': None},
+                          {'$or': [{'_id': {'$lt': ObjectId(OBJECT_ID)}}, {'_id': None}]}]}]
+    }
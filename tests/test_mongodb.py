@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+from bson.objectid import ObjectId
+from storm.db import Connection
+from storm.error import StormNotFoundError
+from storm.model import Model
+from storm.mongodb import MongoDb
+from tests.fakes import fake_mongo
+
+OBJECT_ID = ObjectId('5f1d7a3b9c1e4a2b3c4d5e6f')
+
+
+class User(Model):
+    _table = 'users'
+    _primary_key = '_id'
+
+
+@pytest.fixture
+def db():
+    db = fake_mongo([{'_id': OBJECT_ID, 'name': 'craig', 'type': 'admin'},
+                     {'_id': ObjectId(), 'name': 'bob', 'type': 'basic'},
+                     {'_id': ObjectId(), 'name': 'sue', 'type': 'basic'}])
+    Model.set_db(db)
+    return db
+
+
+def users(db):
+    return db.db['users']
+
+
+def test_find(db):
+    user = asyncio.run(User.find(_id=str(OBJECT_ID)))
+
+    assert user.name == 'craig' and user._id == str(OBJECT_ID)
+    assert db.db.calls == [('users', 'find_one', {'_id': OBJECT_ID})]
+
+
+def test_find_not_found(db):
+    with pytest.raises(StormNotFoundError):
+        asyncio.run(User.find(name='nobody'))
+
+
+def test_find_all_counts_the_filter(db):
+    found = asyncio.run(User.find_all({'type': 'basic'}, page=1, page_size=1))
+
+    assert [user.name for user in found] == ['bob']
+    assert found.total_count == 2
+    assert users(db).cursors[0].sorted_by == [('_id', -1)]
+    assert db.db.calls[-1] == ('users', 'count_documents', {'type': 'basic'})
+
+
+def test_find_all_estimates_a_whole_collection(db):
+    found = asyncio.run(User.find_all({}, page=1, page_size=2, count='estimate'))
+
+    assert len(found) == 2 and found.has_more
+    assert found.total_count == 3
+    assert db.db.calls[-1] == ('users', 'estimated_document_count')
+
+
+def test_select_in(db):
+    rows = asyncio.run(db.select_in('users', '_id', [str(OBJECT_ID)]))
+
+    assert [row['name'] for row in rows] == ['craig']
+
+
+def test_insert(db):
+    user = User()
+    user.name = 'new'
+    asyncio.run(user.save())
+
+    assert db.db.calls[-1][1] == 'insert_one'
+    assert isinstance(user._id, str)
+    assert users(db).documents[-1] == {'_id': ObjectId(user._id), 'name': 'new'}
+
+
+def test_save_many_inserts_at_once(db):
+    new_users = [User(), User()]
+    for i, user in enumerate(new_users):
+        user.name = 'new %s' % i
+
+    asyncio.run(User.save_many(new_users))
+
+    assert [call[1] for call in db.db.calls] == ['insert_many']
+    assert [user._id for user in new_users] == [str(document['_id']) for document in users(db).documents[3:]]
+
+
+def test_delete(db):
+    user = asyncio.run(User.find(_id=str(OBJECT_ID)))
+    asyncio.run(user.delete())
+
+    assert db.db.calls[-1] == ('users', 'delete_one', {'_id': OBJECT_ID})
+    assert len(users(db).documents) == 2
+
+
+def test_delete_many(db):
+    ids = [str(document['_id']) for document in users(db).documents[1:]]
+
+    assert asyncio.run(db.delete_many('users', '_id', ids)) == 2
+    assert users(db).documents == [{'_id': OBJECT_ID, 'name': 'craig', 'type': 'admin'}]
+
+
+def test_iter_all(db):
+    async def run():
+        async with User.iter_all({}, batch_size=2) as found:
+            return [await found.next_batch(), await found.next_batch(), await found.next_batch()]
+
+    batches = asyncio.run(run())
+
+    assert [[user.name for user in batch] for batch in batches] == [['craig', 'bob'], ['sue'], []]
+    assert users(db).cursors[0].closed
+
+
+def test_connect():
+    async def run():
+        db = MongoDb(Connection(database='test'), max_pool_size=3)
+        await db.connect()
+        options = db.motor_client.options.pool_options
+        await db.close()
+        return db, options
+
+    db, options = asyncio.run(run())
+
+    assert options.max_pool_size == 3
+    assert db.db.name == 'test' and not db.is_connected
+
+
+def test_update_sets_and_unsets_the_changes(db):
+    user = asyncio.run(User.find(_id=str(OBJECT_ID)))
+    user.name = 'new'
+    del user.type
+    asyncio.run(user.save())
+
+    assert db.db.calls[-1] == ('users', 'update_one', {'_id': OBJECT_ID},
+                               {'$set': {'name': 'new'}, '$unset': {'type': ''}})
+    assert users(db).documents[0] == {'_id': OBJECT_ID, 'name': 'new'}
+
+
+def test_update_without_changes_does_nothing(db):
+    data = {'_id': str(OBJECT_ID), 'name': 'craig'}
+
+    assert asyncio.run(db.update('users', data, [], '_id')) is False
+    assert asyncio.run(db.update('users', data, ['_id'], '_id')) is False
+    assert db.db.calls == []
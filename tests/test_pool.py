@@ -0,0 +1,117 @@
+import asyncio
+import pytest
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado_mysql import pools
+from storm.db import Connection
+from storm.mysql import AdaptivePool, MySql
+
+
+class FakeConnection(object):
+    def __init__(self, opened):
+        self.connected_time = opened
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def close_async(self):
+        self.closed = True
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """replaces tornado_mysql's connect so the pool opens fake connections"""
+    opened = []
+
+    def connect(**kwargs):
+        opened.append(FakeConnection(IOLoop.current().time()))
+        future = Future()
+        future.set_result(opened[-1])
+        return future
+
+    monkeypatch.setattr(pools, 'connect', connect)
+    return opened
+
+
+def test_grows_when_queries_wait(connect):
+    async def run():
+        pool = AdaptivePool({}, min_size=1, max_size=2)
+        first = await pool._get_conn()
+
+        # the first query to wait only queues, the next one opens a connection
+        waiting = pool._get_conn()
+        second = await pool._get_conn()
+        assert pool.stats()['waiters'] == 1
+
+        pool._put_conn(first)
+        assert await waiting is first
+
+        # it never goes past max_size
+        third = pool._get_conn()
+        fourth = pool._get_conn()
+        assert not third.done() and not fourth.done()
+        pool._put_conn(second)
+        pool._put_conn(first)
+        await asyncio.gather(third, fourth)
+
+        return pool.stats()
+
+    stats = asyncio.run(run())
+
+    assert len(connect) == 2
+    assert stats['size'] == 2 and stats['limit'] == 2 and stats['in_use'] == 2
+    assert stats['waits'] == 3
+
+
+def test_without_adaptive_it_opens_up_to_max_size(connect):
+    async def run():
+        pool = AdaptivePool({}, min_size=1, max_size=3, adaptive=False)
+        return [await pool._get_conn() for i in range(3)], pool.stats()
+
+    conns, stats = asyncio.run(run())
+
+    assert len(connect) == 3 and stats['waiters'] == 0
+
+
+def test_idle_connections_are_closed(connect):
+    async def run():
+        # open three connections and let them all go idle
+        pool = AdaptivePool({}, min_size=1, max_size=3, adaptive=False, idle_timeout=0.01)
+        conns = [await pool._get_conn() for i in range(3)]
+        for conn in conns:
+            pool._put_conn(conn)
+
+        pool.adaptive = True
+        await asyncio.sleep(0.02)
+        await pool._get_conn()
+
+        # the pool counts them as closed once close_async is done
+        await asyncio.sleep(0)
+        return pool.stats()
+
+    stats = asyncio.run(run())
+
+    assert [conn.closed for conn in connect] == [True, True, False]
+    assert stats['size'] == 1 and stats['limit'] == 1
+
+
+def test_mysql_uses_an_adaptive_pool(connect):
+    async def run():
+        db = MySql(Connection(database='test'), min_pool_size=2, max_pool_size=5)
+        await db.connect()
+        stats = db.stats()
+        conn = await db.db._get_conn()
+        db.db._put_conn(conn)
+        await db.close()
+        return db, stats
+
+    db, stats = asyncio.run(run())
+
+    assert db.db.max_size == 5 and stats['limit'] == 2
+
+    # closing the db closes the connections of its pool
+    assert connect[0].closed and db.stats() is None
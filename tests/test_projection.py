@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from storm.error import StormError
+from storm.model import Model
+from storm.mongodb import MongoDb
+from storm.mysql import Query
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+
+
+@pytest.fixture
+def db():
+    db = fake_mysql([{'id': 1, 'name': 'craig', 'email': 'craig@example.com', 'bio': 'hi', 'n': 2}])
+    Model.set_db(db)
+    return db
+
+
+def test_exclude_on_find_all_selects_everything(db):
+    query = Query('SELECT id, name, count(*) AS n FROM :table GROUP BY id')
+    users = asyncio.run(User.find_all(query, exclude=['bio']))
+
+    assert db.db.sql == ['SELECT id, name, count(*) AS n FROM `users` GROUP BY id']
+    assert users[0].n == 2
+    assert not hasattr(users[0], 'bio')
+    assert users[0].is_partial()
+
+
+def test_exclude_on_find_looks_up_the_columns(db):
+    user = asyncio.run(User.find(id=1, exclude=['bio']))
+
+    assert db.db.sql[0] == 'SHOW COLUMNS FROM `users`'
+    assert db.db.sql[1].startswith('SELECT `id`, `name`, `email`, `n` FROM `users`')
+    assert user.is_partial()
+
+
+def test_fields_are_selected(db):
+    users = asyncio.run(User.find_all(Query('SELECT * FROM :table'), fields=['name']))
+
+    assert db.db.sql == ['SELECT `name`, `id` FROM (SELECT * FROM `users`) AS `storm_filtered`']
+    assert users[0].is_partial()
+
+
+def test_partial_save_never_clears_fields_that_were_not_loaded(db):
+    user = asyncio.run(User.find_all(Query('SELECT * FROM :table'), exclude=['bio']))[0]
+    user.name = 'new'
+    user.bio = 'not loaded'
+    del user.bio
+    asyncio.run(user.save())
+
+    assert db.db.statements[-1] == ('UPDATE `users` SET `name` = %s WHERE `id` = %s', ['new', 1])
+
+
+def test_partial_objects_can_not_be_inserted(db):
+    user = asyncio.run(User.find_all(Query('SELECT * FROM :table'), fields=['name']))[0]
+    del user.id
+
+    with pytest.raises(StormError):
+        asyncio.run(user.save())
+
+
+def test_mongo_projection():
+    assert MongoDb._projection(None, None) is None
+    assert MongoDb._projection(['name'], None) == {'name': 1}
+    assert MongoDb._projection(None, ['bio']) == {'bio': 0}
@@ -0,0 +1,85 @@
+import pytest
+from storm.error import StormError
+from storm.mysql import Query
+
+
+def users_query(sql='SELECT * FROM :table'):
+    return Query(sql).bind(':table', 'users')
+
+
+def test_binds_are_parameters():
+    query = users_query('SELECT * FROM :table WHERE type = :type').bind(':type', "o'brien")
+
+    assert query.sql == 'SELECT * FROM `users` WHERE type = %s'
+    assert query.params == ["o'brien"]
+
+
+def test_percent_signs_in_the_query_are_escaped():
+    query = users_query("SELECT * FROM :table WHERE name LIKE 'a%'")
+
+    assert query.sql == "SELECT * FROM `users` WHERE name LIKE 'a%%'"
+
+
+def test_filters_wrap_the_query():
+    query = users_query('SELECT * FROM :table WHERE type = :type').bind(':type', 'basic')
+    query.filter('age', '>', 3)
+    query.filter('id', 'in', [1, 2])
+
+    assert query.sql == ('SELECT * FROM (SELECT * FROM `users` WHERE type = %s) AS `storm_filtered` '
+                         'WHERE `age` > %s AND `id` IN (%s, %s)')
+    assert query.params == ['basic', 3, 1, 2]
+
+
+def test_string_filters_compare_binary():
+    query = users_query()
+    query.filter('name', '=', 'Craig')
+
+    assert query.sql.endswith('WHERE (`name` <=> %s AND BINARY `name` <=> %s)')
+    assert query.params == ['Craig', 'Craig']
+
+
+def test_filters_that_cant_be_sql_run_in_python():
+    query = users_query()
+    query.filter('settings', '=', {'a': 1})
+
+    assert query.sql == 'SELECT * FROM `users`'
+    assert query.apply_filters([{'settings': {'a': 1}}, {'settings': {}}]) == ([{'settings': {'a': 1}}], 1)
+
+
+def test_python_filters_can_not_be_paginated():
+    query = users_query()
+    query.filter('settings', '=', {'a': 1})
+    query.limit = 10
+
+    with pytest.raises(StormError):
+        query.apply_filters([{'settings': {'a': 1}}])
+
+
+def test_filters_and_pages_are_one_query():
+    query = users_query()
+    query.filter('age', '>', 3)
+    query.limit = 10
+    query.offset = 20
+
+    assert query.sql == 'SELECT * FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE `age` > %s LIMIT %s OFFSET %s'
+    assert query.params == [3, 10, 20]
+    assert query.count_sql == 'SELECT count(*) count FROM (SELECT * FROM `users`) AS `storm_filtered` WHERE `age` > %s'
+    assert query.count_params == [3]
+
+
+def test_joins_are_not_wrapped():
+    query = Query('SELECT * FROM users u JOIN posts p ON p.user_id = u.id')
+    query.filter('name', '=', 'Craig')
+    query.fields = ['name']
+
+    assert query.sql == 'SELECT * FROM users u JOIN posts p ON p.user_id = u.id'
+    assert query.apply_filters([{'name': 'Craig'}, {'name': 'craig'}]) == ([{'name': 'Craig'}], 1)
+
+
+def test_joins_can_not_use_keyset_pagination():
+    query = Query('SELECT * FROM users, posts WHERE posts.user_id = users.id')
+    query.order = [('id', 1)]
+    query.after = [1]
+
+    with pytest.raises(StormError):
+        query.sql
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from storm.collection import ColumnCollection, rows_to_tuples, rows_to_columns
+from storm.model import Model
+from storm.mysql import Query
+
+ROWS = [{'id': 1, 'name': 'craig', 'settings': '{}'}, {'id': 2, 'name': 'bob', 'settings': '{}'}]
+
+
+class User(Model):
+    _table = 'users'
+    _json_fields = ['settings']
+
+    def after_load(self):
+        raise AssertionError('after_load should not run')
+
+
+@pytest.fixture
+def rows(db):
+    db.db.rows = [dict(row) for row in ROWS]
+    return db
+
+
+def find_all(**args):
+    return asyncio.run(User.find_all(Query('SELECT * FROM :table'), page=1, page_size=10, **args))
+
+
+def test_raw(rows):
+    found = find_all(as_raw=True)
+
+    assert list(found) == ROWS
+    assert found.total_count == 2 and found.page == 1
+
+
+def test_tuples(rows):
+    found = find_all(as_tuples=True)
+
+    assert found.columns == ['id', 'name', 'settings']
+    assert list(found) == [(1, 'craig', '{}'), (2, 'bob', '{}')]
+
+
+def test_columns_as_lists(rows):
+    found = find_all(as_columns='list')
+
+    assert isinstance(found, ColumnCollection)
+    assert found == {'id': [1, 2], 'name': ['craig', 'bob'], 'settings': ['{}', '{}']}
+    assert found.to_dict()['columns']['id'] == [1, 2]
+
+
+def test_columns_as_numpy_arrays(rows):
+    numpy = pytest.importorskip('numpy')
+    found = find_all(as_columns=True, fields=['id'])
+
+    assert isinstance(found['id'], numpy.ndarray)
+    assert found['id'].sum() == 3
+
+
+def test_rows_with_different_columns():
+    rows = [{'id': 1}, {'id': 2, 'name': 'bob'}]
+
+    assert rows_to_tuples(rows) == (['id', 'name'], [(1, None), (2, 'bob')])
+    assert rows_to_tuples([{'id': 1}]) == (['id'], [(1,)])
+    assert rows_to_columns(rows, use_numpy=False) == {'id': [1, 2], 'name': [None, 'bob']}
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from storm.error import StormError
+from storm.model import Model, DeclaredModel
+from storm.mysql import Query
+from storm.relation import BelongsTo, HasMany
+
+
+class Author(Model):
+    _table = 'authors'
+    _relations = {'posts': HasMany('Article', 'author_id')}
+
+
+class Article(Model):
+    _table = 'articles'
+    _relations = {'author': BelongsTo('Author', 'author_id')}
+
+
+class DeclaredArticle(DeclaredModel):
+    _table = 'articles'
+    _fields = ('id', 'author_id')
+    _relations = {'author': BelongsTo(Author, 'author_id')}
+
+
+@pytest.fixture
+def tables(db):
+    db.db.tables = {
+        'authors': [{'id': 1, 'name': 'craig'}, {'id': 2, 'name': 'bob'}],
+        'articles': [{'id': 10, 'author_id': 1}, {'id': 11, 'author_id': 1}, {'id': 12, 'author_id': None}]
+    }
+    return db.db
+
+
+def test_belongs_to(tables):
+    articles = asyncio.run(Article.find_all(Query('SELECT * FROM :table'), include=['author']))
+
+    assert [article.author and article.author.name for article in articles] == ['craig', 'craig', None]
+    assert tables.statements[-1] == ('SELECT * FROM `authors` WHERE `id` IN (%s)', [1])
+
+
+def test_has_many(tables):
+    authors = asyncio.run(Author.find_all(Query('SELECT * FROM :table'), include=['posts']))
+
+    assert [[post.id for post in author.posts] for author in authors] == [[10, 11], []]
+    assert tables.statements[-1] == ('SELECT * FROM `articles` WHERE `author_id` IN (%s, %s)', [1, 2])
+
+
+def test_declared_models_have_slots_for_relations(tables):
+    articles = asyncio.run(DeclaredArticle.find_all(Query('SELECT * FROM :table'), include=['author']))
+
+    assert articles[0].author.name == 'craig'
+    assert articles[0]._changes == set()
+
+
+def test_unknown_relations(tables):
+    with pytest.raises(StormError):
+        asyncio.run(Article.find_all(Query('SELECT * FROM :table'), include=['comments']))
+
+
+def test_relations_need_objects(tables):
+    with pytest.raises(StormError):
+        asyncio.run(Article.find_all(Query('SELECT * FROM :table'), include=['author'], as_raw=True))
+
+
+def test_unknown_models():
+    with pytest.raises(StormError):
+        BelongsTo('Nobody', 'nobody_id').get_model()
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from storm import context
+from storm.model import Model
+from storm.mysql import MySqlTransaction
+from storm.routing import ReplicaPool, LEAST_OUTSTANDING
+from tests.fakes import fake_mysql
+
+ROWS = [{'id': 1, 'name': 'craig'}]
+
+
+class User(Model):
+    _table = 'users'
+
+
+@pytest.fixture
+def dbs():
+    primary, replicas = fake_mysql(ROWS), [fake_mysql(ROWS), fake_mysql(ROWS)]
+    return primary, replicas
+
+
+def reads(db):
+    return len([sql for sql in db.db.sql if sql.startswith('SELECT')])
+
+
+def test_reads_go_to_the_replicas_in_turn(dbs):
+    primary, replicas = dbs
+    Model.set_db(ReplicaPool(primary, replicas))
+
+    for i in range(4):
+        asyncio.run(User.find(id=1))
+
+    assert [reads(primary)] + [reads(replica) for replica in replicas] == [0, 2, 2]
+
+
+def test_reads_after_a_write_in_a_scope_go_to_the_primary(dbs):
+    primary, replicas = dbs
+    Model.set_db(ReplicaPool(primary, replicas))
+
+    async def run():
+        with context.bind():
+            db = await Model.get_db()
+            await User.find(id=1)
+            assert db.get_read_key() == 'replica'
+
+            user = User()
+            user.name = 'new'
+            await user.save()
+
+            assert db.get_read_key() == 'primary'
+            await User.find(id=1)
+
+        # a new scope starts on the replicas again
+        await User.find(id=1)
+
+    asyncio.run(run())
+
+    assert primary.db.sql == ['INSERT INTO `users` (`name`) VALUES (%s)', 'SELECT * FROM `users` WHERE BINARY `id` = %s']
+    assert [reads(replica) for replica in replicas] == [1, 1]
+
+
+def test_least_outstanding(dbs):
+    primary, replicas = dbs
+    pool = ReplicaPool(primary, replicas, strategy=LEAST_OUTSTANDING)
+    Model.set_db(pool)
+    replicas[0].db.delay = 0.05
+
+    async def run():
+        slow = asyncio.ensure_future(User.find(id=1))
+        await asyncio.sleep(0.01)
+
+        # the first replica is still busy so the next reads go to the other
+        await User.find(id=2)
+        await User.find(id=3)
+        await slow
+
+    asyncio.run(run())
+
+    assert [reads(replica) for replica in replicas] == [1, 2]
+    assert pool.outstanding == [0, 0]
+
+
+def test_without_replicas_everything_goes_to_the_primary(dbs):
+    primary, replicas = dbs
+    Model.set_db(ReplicaPool(primary, []))
+
+    asyncio.run(User.find(id=1))
+
+    assert reads(primary) == 1
+
+
+def test_transactions_run_on_the_primary(dbs):
+    primary, replicas = dbs
+    pool = ReplicaPool(primary, replicas)
+
+    async def run():
+        db = await pool.get_db()
+        return await db.begin()
+
+    assert isinstance(asyncio.run(run()), MySqlTransaction)
+    assert primary.db.sql == ['BEGIN']
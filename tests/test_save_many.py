@@ -0,0 +1,63 @@
+import asyncio
+from storm.model import Model
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+
+
+def test_insert_many_groups_rows_by_fields():
+    db = fake_mysql()
+    ids = asyncio.run(db.insert_many('users', [{'name': 'a'}, {'name': 'b', 'age': 3}, {'name': 'c'}], 'id'))
+
+    assert db.db.sql[1:] == ['INSERT INTO `users` (`name`) VALUES (%s), (%s)',
+                             'INSERT INTO `users` (`age`, `name`) VALUES (%s, %s)']
+    assert ids == [1, 3, 2]
+
+
+def test_insert_many_ids_follow_the_increment():
+    db = fake_mysql(increment=5)
+    ids = asyncio.run(db.insert_many('users', [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}], 'id'))
+
+    assert ids == [1, 6, 11]
+
+
+def test_insert_many_inserts_one_at_a_time_with_interleaved_ids():
+    db = fake_mysql(lock_mode=2)
+    ids = asyncio.run(db.insert_many('users', [{'name': 'a'}, {'name': 'b'}], 'id'))
+
+    assert db.db.sql[1:] == ['INSERT INTO `users` (`name`) VALUES (%s)'] * 2
+    assert ids == [1, 2]
+
+
+def test_insert_many_keeps_rows_with_a_primary_key_batched():
+    db = fake_mysql(lock_mode=2)
+    ids = asyncio.run(db.insert_many('users', [{'id': 7, 'name': 'a'}, {'id': 9, 'name': 'b'}], 'id'))
+
+    assert db.db.sql == ['INSERT INTO `users` (`id`, `name`) VALUES (%s, %s), (%s, %s)']
+    assert ids == [7, 9]
+
+
+def test_save_many_inserts_one_statement_per_table(db):
+    users = [User(), User()]
+    for i, user in enumerate(users):
+        user.name = 'user %d' % i
+
+    asyncio.run(User.save_many(users))
+
+    assert db.db.sql[-1] == 'INSERT INTO `users` (`name`) VALUES (%s), (%s)'
+    assert [user.id for user in users] == [1, 2]
+    assert all(len(user._changes) == 0 for user in users)
+
+
+def test_save_many_updates_the_objects_that_exist(db):
+    user = asyncio.run(User.find(id=1))
+    user.name = 'new'
+    new_user = User()
+    new_user.name = 'other'
+
+    asyncio.run(User.save_many([user, new_user]))
+
+    assert db.db.sql[1:] == ['UPDATE `users` SET `name` = %s WHERE `id` = %s',
+                             'INSERT INTO `users` (`name`) VALUES (%s)']
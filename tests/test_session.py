@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from storm.error import StormError
+from storm.model import Model
+from storm.mysql import Query, MySqlTransaction
+from storm.session import Session
+from tests.fakes import fake_mysql
+
+
+class User(Model):
+    _table = 'users'
+
+
+class Post(Model):
+    _table = 'posts'
+
+
+def test_flush_writes_in_one_transaction(db):
+    user = asyncio.run(User.find(id=1))
+    user.name = 'new'
+    post = Post()
+    post.title = 'hello'
+
+    session = Session()
+    session.add_all([user, post])
+    asyncio.run(session.flush())
+
+    assert db.db.sql[1:] == ['BEGIN',
+                             'UPDATE `users` SET `name` = %s WHERE `id` = %s',
+                             'INSERT INTO `posts` (`title`) VALUES (%s)',
+                             'COMMIT']
+    assert post.id == 1
+    assert user._changes == [] and post._changes == []
+
+
+def test_flush_rolls_back(db):
+    db.db.fail_on = 'DELETE'
+    user = asyncio.run(User.find(id=1))
+    user.name = 'new'
+    post = Post()
+    post.title = 'hello'
+    old_post = asyncio.run(Post.find(id=1))
+
+    session = Session()
+    session.add_all([user, post])
+    session.delete(old_post)
+    with pytest.raises(RuntimeError):
+        asyncio.run(session.flush())
+
+    assert db.db.sql[-3:] == ['INSERT INTO `posts` (`title`) VALUES (%s)',
+                              'DELETE FROM `posts` WHERE `id` IN (%s)',
+                              'ROLLBACK']
+
+    # the objects keep their changes and the new one is new again
+    assert user._changes == ['name']
+    assert not hasattr(post, 'id')
+    assert session.new == [post]
+    assert session.dirty == [user]
+
+
+def test_flush_deletes(db):
+    user = asyncio.run(User.find(id=1))
+
+    session = Session()
+    session.delete(user)
+    asyncio.run(session.flush())
+
+    assert db.db.sql[1:] == ['BEGIN', 'DELETE FROM `users` WHERE `id` IN (%s)', 'COMMIT']
+    assert session.deleted == []
+
+
+def begin(rows):
+    db = fake_mysql(rows)
+    db.db.delay = 0.001
+    return db, asyncio.run(db.begin())
+
+
+def test_transaction_runs_statements_one_at_a_time():
+    db, transaction = begin([{'id': i} for i in range(25)])
+    assert isinstance(transaction, MySqlTransaction)
+
+    async def run():
+        await transaction.select_multiple('users', Query('SELECT * FROM :table'), page=1, page_size=10)
+        await transaction.select_in('users', 'id', list(range(2500)))
+
+    asyncio.run(run())
+
+    assert len(db.db.statements) == 6
+    assert db.db.max_running == 1
+
+
+def test_transaction_select_iter_reads_on_the_transaction():
+    db, transaction = begin([{'id': i} for i in range(5)])
+
+    async def run():
+        stream = await transaction.select_iter('users', Query('SELECT * FROM :table'), batch_size=2)
+        batches = []
+        while True:
+            batch = await stream.fetch_batch()
+            if len(batch) == 0:
+                return batches
+
+            batches.append([row['id'] for row in batch])
+
+    assert asyncio.run(run()) == [[0, 1], [2, 3], [4]]
+    assert db.db.sql == ['BEGIN', 'SELECT * FROM `users`']
+
+
+def test_transaction_can_not_be_used_after_commit():
+    db, transaction = begin([])
+    asyncio.run(transaction.commit())
+
+    with pytest.raises(StormError):
+        asyncio.run(transaction.select_one('users', id=1))
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from storm.error import StormNotFoundError
+from storm.mysql import MySql
+from tests.fakes import fake_mysql
+
+
+def test_select_one_is_parameterized():
+    db = fake_mysql([{'id': 1, 'name': "o'brien"}])
+    asyncio.run(db.select_one('users', name="o'brien"))
+    asyncio.run(db.select_one('users', name='craig'))
+
+    (first, first_params), (second, second_params) = db.db.statements
+    assert first == 'SELECT * FROM `users` WHERE BINARY `name` = %s'
+    assert first_params == ["o'brien"]
+    assert second_params == ['craig']
+
+    # the text is built once for each shape of statement
+    assert first is second
+
+
+def test_select_one_not_found():
+    db = fake_mysql()
+
+    with pytest.raises(StormNotFoundError):
+        asyncio.run(db.select_one('users', id=1))
+
+
+def test_insert_and_update_keep_now_in_the_sql():
+    db = fake_mysql()
+    asyncio.run(db.insert('users', {'name': 'craig', 'created': 'NOW()'}))
+    asyncio.run(db.update('users', {'id': 1, 'name': 'craig', 'modified_on': None}, ['name'], 'id'))
+
+    assert db.db.statements == [
+        ('INSERT INTO `users` (`name`, `created`) VALUES (%s, NOW())', ['craig']),
+        ('UPDATE `users` SET `name` = %s, `modified_on` = NOW() WHERE `id` = %s', ['craig', 1])
+    ]
+
+
+def test_update_sets_deleted_fields_to_null():
+    db = fake_mysql()
+    asyncio.run(db.update('users', {'id': 1}, ['name'], 'id'))
+
+    assert db.db.statements == [('UPDATE `users` SET `name` = %s WHERE `id` = %s', [None, 1])]
+
+
+def test_delete():
+    db = fake_mysql()
+    asyncio.run(db.delete('users', ['id'], [1]))
+    asyncio.run(db.delete_many('users', 'id', [1, 2]))
+
+    assert db.db.statements == [('DELETE FROM `users` WHERE `id` = %s', [1]),
+                                ('DELETE FROM `users` WHERE `id` IN (%s, %s)', [1, 2])]
+
+
+def test_quote():
+    assert MySql._quote(None) == 'null'
+    assert MySql._quote(5) == '5'
+    assert MySql._quote("o'brien") == "'o\\'brien'"